@@ -1,179 +1,198 @@
-import cv2
 import time
-import os
 from datetime import datetime
-from flask import Flask, Response
+from flask import Flask, Response, abort, jsonify, request
 import logging
 
 # Correctly import modules from the 'src' directory.
-from src.detection import detect_persons
-from src.tracking import initialize_tracker, update_tracker_with_detections
-from src.face_recognition_util import load_known_faces, recognize_face
-from src.alerting import trigger_alert, trigger_banned_person_alert
-from src.video_stream import VideoStream
+from src.recognition_pool import RecognitionPool
+from src.gallery_watcher import GalleryWatcher
+from src.alerting import get_dispatcher
+from src.camera_manager import CameraManager, load_camera_configs, open_streams
+from src.zones import load_zone_configs
 from src.event_logger import setup_logger
+from src.event_store import get_event_store
+from src.lifecycle import LifecycleManager
+from src.sharding import PIPELINE_SHARDS, ShardedCameraManager
+from src.metrics import REGISTRY
 
 logger = setup_logger()
 app = Flask(__name__)
 
-# --- CONFIGURATION (Unchanged) ---
+# --- CONFIGURATION ---
+# Per-camera settings (source, resolution, tracker) live in cameras.json and
+# polygon zones in zones.json; see src/camera_manager.py and src/zones.py. The processing constants live in src/pipeline.py.
 FRAME_WIDTH, FRAME_HEIGHT = 1280, 720
-FRAME_PROCESSING_INTERVAL = 3
-RE_RECOGNITION_INTERVAL_FRAMES = 15 
-TIME_THRESHOLD_SECONDS = 10.0
-TRACK_TTL_SECONDS = 2.0
-ZONE_START_X, ZONE_START_Y, ZONE_WIDTH, ZONE_HEIGHT = 0, 0, 350, 720
-FORBIDDEN_ZONE = (ZONE_START_X, ZONE_START_Y, ZONE_START_X + ZONE_WIDTH, ZONE_START_Y + ZONE_HEIGHT)
-UNKNOWN_SIGHTINGS_DIR = "unknown_person_sightings"
-if not os.path.exists(UNKNOWN_SIGHTINGS_DIR): os.makedirs(UNKNOWN_SIGHTINGS_DIR)
-
-# --- GLOBAL INITIALIZATION ---
-logger.info("Initializing resources...")
-from ultralytics import YOLO
-model = YOLO('yolov8n.pt')
-tracker = initialize_tracker()
-known_face_encodings, known_face_identities = load_known_faces("registered_faces")
-
-logger.info("Starting threaded video stream...")
-vs = VideoStream(src=0, width=FRAME_WIDTH, height=FRAME_HEIGHT).start()
-time.sleep(2.0)
-logger.info("Initialization Complete. Starting Web Server.")
-
-# --- MAIN VIDEO PROCESSING LOGIC (Unchanged) ---
-def process_video_frames():
-    frame_count = 0
-    last_alert_time = 0
-    tracked_persons = {}
-
-    while True:
-        frame = vs.read()
-        if frame is None: break
-        frame_count += 1
-        current_time = time.time()
-        
-        if frame_count % FRAME_PROCESSING_INTERVAL == 0:
-            processing_frame = frame.copy()
-            detections = detect_persons(model, processing_frame)
-            tracks = update_tracker_with_detections(tracker, detections, processing_frame)
-            
-            active_track_ids = set()
-            for track in tracks:
-                if not track.is_confirmed() or track.time_since_update > 0: continue
-                
-                track_id, ltrb = track.track_id, track.to_ltrb()
-                active_track_ids.add(track_id)
-
-                is_new_person = track_id not in tracked_persons
-                if is_new_person:
-                    x1, y1, x2, y2 = map(int, ltrb)
-                    person_crop = processing_frame[y1:y2, x1:x2]
-                    name, status, distance = "Unknown", "unknown", 0.0
-                    if person_crop.size > 0:
-                        name, status, distance = recognize_face(known_face_encodings, known_face_identities, person_crop)
-
-                    tracked_persons[track_id] = {
-                        "box": ltrb, "name": name, "status": status, "distance": distance,
-                        "loiter_start_time": None, "alert_triggered": False, "last_seen_time": current_time
-                    }
-                    log_message = f"Person '{name}' (ID: {track_id}, Status: {status.capitalize()}) detected."
-                    if status == 'unknown': logger.warning(log_message)
-                    else: logger.info(log_message)
-                    
-                    if status == 'unknown':
-                        try:
-                            sighting_filename = os.path.join(UNKNOWN_SIGHTINGS_DIR, f"sighting_id-{track_id}.jpg")
-                            cv2.imwrite(sighting_filename, person_crop)
-                        except Exception: pass
-                
-                person_state = tracked_persons[track_id]
-                person_state.update({"box": ltrb, "last_seen_time": current_time})
-
-                if person_state["status"] == "unknown" and frame_count % RE_RECOGNITION_INTERVAL_FRAMES == 0 and not is_new_person:
-                    x1, y1, x2, y2 = map(int, ltrb)
-                    person_crop = processing_frame[y1:y2, x1:x2]
-                    if person_crop.size > 0:
-                        name, status, dist = recognize_face(known_face_encodings, known_face_identities, person_crop)
-                        if status != "unknown":
-                            logger.info(f"Person ID {track_id} re-identified as '{name}' (Status: {status.capitalize()}).")
-                            person_state.update({"name": name, "status": status, "distance": dist, "loiter_start_time": None, "alert_triggered": False})
-                
-                person_center_x = (ltrb[0] + ltrb[2]) / 2
-                is_in_zone = (person_center_x > FORBIDDEN_ZONE[0] and person_center_x < FORBIDDEN_ZONE[2])
-
-                if is_in_zone and not person_state["alert_triggered"]:
-                    status = person_state["status"]
-                    if status == "banned":
-                        trigger_banned_person_alert(frame, person_state["name"])
-                        person_state["alert_triggered"] = True
-                    elif status == "unknown":
-                        if person_state["loiter_start_time"] is None:
-                            person_state["loiter_start_time"] = current_time
-                        else:
-                            loiter_duration = current_time - person_state["loiter_start_time"]
-                            if loiter_duration > TIME_THRESHOLD_SECONDS:
-                                last_alert_time = trigger_alert(frame, last_alert_time)
-                                person_state["alert_triggered"] = True
-                elif not is_in_zone:
-                    person_state["loiter_start_time"] = None
-            
-            inactive_ids = set(tracked_persons.keys()) - active_track_ids
-            stale_ids = {tid for tid, p in tracked_persons.items() if current_time - p["last_seen_time"] > TRACK_TTL_SECONDS}
-            for inactive_id in inactive_ids.union(stale_ids):
-                if inactive_id in tracked_persons: del tracked_persons[inactive_id]
-        
-        # --- MODIFIED: Drawing Logic with Corrected Color Scheme ---
-        for track_id, person in tracked_persons.items():
-            x1, y1, x2, y2 = map(int, person["box"])
-            status = person["status"]
-            label = f"{person['name']} (ID: {track_id})"
-
-            # Set box color based on your specified scheme
-            if status == "banned":
-                box_color = (0, 165, 255)  # Orange for Banned
-            elif status == "allowed" or status == "known":
-                box_color = (255, 0, 0)    # Blue for Allowed and Known
-            else: # Unknown
-                box_color = (0, 255, 0)    # Green for Unknown
-
-            # If unknown is loitering, override color to Red
-            if status == "unknown" and person["loiter_start_time"] is not None:
-                box_color = (0, 0, 255)    # Red for Loitering
-                loiter_duration = current_time - person["loiter_start_time"]
-                label += f" | T: {loiter_duration:.0f}s"
-            
-            cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 2)
-            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
-
-        # Draw Restricted Zone in Red (Unchanged, already correct)
-        cv2.rectangle(frame, (FORBIDDEN_ZONE[0], FORBIDDEN_ZONE[1]), (FORBIDDEN_ZONE[2], FORBIDDEN_ZONE[3]), (0, 0, 255), 2)
-        cv2.putText(frame, "Restricted Zone", (FORBIDDEN_ZONE[0] + 10, FORBIDDEN_ZONE[1] + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if ret: yield (b'--frame\r\n'b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-
-# --- FLASK WEB ROUTES (Unchanged) ---
+FIRST_FRAME_TIMEOUT_SECONDS = 10.0
+# How long a /video_feed request waits for the cameras to come up before giving up with 503.
+FEED_READY_TIMEOUT_SECONDS = 60.0
+
+# --- LIFECYCLE ---
+# Nothing is loaded at import time: `lifecycle.start()` initializes every component on its
+# own thread (model, gallery and camera warm-up in parallel) while the web server is already up.
+camera_configs = load_camera_configs()
+
+def load_model():
+    from ultralytics import YOLO
+    return YOLO('yolov8n.pt')
+
+# camera id -> seconds until its first frame (None if it had not delivered one in time)
+first_frame_seconds = {}
+
+def warm_up_cameras():
+    """Opens every camera and waits for its first frame instead of sleeping a fixed time."""
+    streams = open_streams(camera_configs)
+    deadline = time.monotonic() + FIRST_FRAME_TIMEOUT_SECONDS
+    for camera_id, stream in streams.items():
+        start = time.monotonic()
+        if stream.wait_first_frame(max(0.0, deadline - start)):
+            first_frame_seconds[camera_id] = time.monotonic() - start
+        else:
+            # The camera keeps reconnecting in the background; the others are not held up.
+            first_frame_seconds[camera_id] = None
+            logger.warning(f"Camera '{camera_id}' delivered no frame within {FIRST_FRAME_TIMEOUT_SECONDS:.0f}s.")
+    return streams
+
+def stop_streams(streams):
+    for stream in streams.values(): stream.stop()
+
+def start_shards():
+    """Starts the multi-process pipeline and waits until every analysis process has loaded its model."""
+    manager = ShardedCameraManager(camera_configs, shards=PIPELINE_SHARDS, zone_configs=load_zone_configs()).start()
+    if not manager.wait_ready():
+        manager.stop()
+        raise TimeoutError("Analysis processes did not become ready in time")
+    return manager
+
+lifecycle = (
+    LifecycleManager()
+    .add("event_store", get_event_store, stop=lambda store: store.stop())
+    .add("alerts", get_dispatcher, stop=lambda dispatcher: dispatcher.stop())
+)
+if PIPELINE_SHARDS:
+    # Capture, analysis and encoding run in their own processes; see src/sharding.py.
+    lifecycle.add("cameras", start_shards, stop=lambda manager: manager.stop(),
+                  # Unhealthy while any stage is down, e.g. waiting to be restarted after a crash.
+                  check=lambda manager: manager.is_running and not manager.health()["stages_down"],
+                  detail=lambda manager: manager.health())
+else:
+    (lifecycle
+        .add("model", load_model)
+        .add("gallery", lambda: GalleryWatcher("registered_faces").start(), stop=lambda watcher: watcher.stop(),
+             detail=lambda watcher: {"identities": len(watcher.gallery.identities), "version": watcher.gallery.version})
+        .add("recognition_pool", RecognitionPool, stop=lambda pool: pool.stop())
+        .add("streams", warm_up_cameras, stop=stop_streams,
+             detail=lambda streams: {"first_frame_seconds": dict(first_frame_seconds)})
+        .add("cameras",
+             lambda model, pool, gallery, streams, *_: CameraManager(model, camera_configs, pool, gallery,
+                                                                 zone_configs=load_zone_configs(), streams=streams).start(),
+             # alerts and event_store are listed only so they are up before the first frame is analysed.
+             depends_on=("model", "recognition_pool", "gallery", "streams", "alerts", "event_store"),
+             stop=lambda manager: manager.stop(), check=lambda manager: manager.is_running))
+
+REGISTRY.gauge("face_cache_hits", lambda: lifecycle.get("gallery").gallery.cache_stats["hits"])
+REGISTRY.gauge("face_cache_misses", lambda: lifecycle.get("gallery").gallery.cache_stats["misses"])
+REGISTRY.gauge("gallery_version", lambda: lifecycle.get("gallery").gallery.version)
+REGISTRY.gauge("app_ready", lambda: lifecycle.ready)
+
+def require(name):
+    """Returns a ready component or answers 503 while it is still starting."""
+    value = lifecycle.get(name)
+    if value is None: abort(503, f"'{name}' is not ready yet")
+    return value
+
+# --- FLASK WEB ROUTES ---
 @app.route('/')
 def index():
+    feeds = "".join(
+        f'<div class="container"><h1>{camera_id}</h1><img src="/video_feed/{camera_id}" alt="Live Feed {camera_id}"></div>'
+        for camera_id in (str(c["id"]) for c in camera_configs))
     return f"""
     <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>AI Surveillance Feed</title>
     <style>
         * {{ box-sizing: border-box; }}
-        body{{background-color:#111;display:flex;justify-content:center;align-items:center;height:100vh;margin:0;font-family:sans-serif;}}
-        .container{{width:{FRAME_WIDTH}px;height:{FRAME_HEIGHT}px;border:2px solid #444;position:relative;}}
+        body{{background-color:#111;display:flex;flex-wrap:wrap;justify-content:center;align-items:center;gap:10px;min-height:100vh;margin:0;font-family:sans-serif;}}
+        .container{{width:{FRAME_WIDTH}px;max-width:100%;aspect-ratio:{FRAME_WIDTH}/{FRAME_HEIGHT};border:2px solid #444;position:relative;}}
         img{{width:100%;height:100%;display:block;}}
         h1{{position:absolute;top:10px;left:10px;color:white;background-color:rgba(0,0,0,0.5);padding:10px;border-radius:5px;font-size:16px;z-index:10;}}
     </style></head>
-    <body><div class="container"><h1>AI Surveillance Feed</h1><img src="/video_feed" alt="Live Feed"></div></body></html>
+    <body>{feeds}</body></html>
     """
 
+@app.route('/admin/gallery/reload', methods=['POST'])
+def reload_gallery():
+    """Re-scans registered_faces and swaps in the updated gallery without restarting."""
+    if PIPELINE_SHARDS: return jsonify(require("cameras").reload_gallery())
+    return jsonify(require("gallery").reload())
+
+@app.route('/stats')
+def stats():
+    """Per-camera throughput and scheduler decisions, stage latency percentiles and alert delivery counters."""
+    camera_manager = require("cameras")
+    stats = {"cameras": camera_manager.stats(), "metrics": REGISTRY.snapshot(),
+             "alerts": require("alerts").stats_snapshot(), "events": require("event_store").stats_snapshot()}
+    if PIPELINE_SHARDS: stats["pipeline"] = camera_manager.pipeline_stats()
+    return jsonify(stats)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: 200 unless a component failed to start or the analysis loop died."""
+    status = lifecycle.status()
+    return jsonify(status), 200 if status["healthy"] else 503
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once every component is up; per-component state and init time either way."""
+    status = lifecycle.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def _event_filters():
+    """Reads event filters from the query string; start/end accept epoch seconds or ISO 8601 times."""
+    filters = {key: request.args.get(key) for key in ("camera_id", "event_type", "status", "track_id", "zone", "name")}
+    for key in ("start", "end"):
+        value = request.args.get(key)
+        if value is None: continue
+        try:
+            filters[key] = float(value)
+        except ValueError:
+            try: filters[key] = datetime.fromisoformat(value).timestamp()
+            except ValueError: abort(400, f"Invalid '{key}': {value}")
+    return filters
+
+@app.route('/events')
+def events():
+    """Paginated event query, newest first. Pass `next_cursor` back as `cursor` for the next page."""
+    try:
+        return jsonify(require("event_store").query(limit=request.args.get("limit", 100, type=int),
+                                         cursor=request.args.get("cursor", type=int), **_event_filters()))
+    except ValueError as e:
+        abort(400, str(e))
+
+@app.route('/events/count')
+def events_count():
+    """Number of events matching the same filters as /events."""
+    return jsonify({"count": require("event_store").count(**_event_filters())})
+
 @app.route('/video_feed')
-def video_feed():
-    return Response(process_video_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=None):
+    # The page is served before the cameras are up, so feeds wait for them here.
+    if not lifecycle.wait("cameras", timeout=FEED_READY_TIMEOUT_SECONDS): abort(503)
+    camera_manager = lifecycle.get("cameras")
+    pipeline = camera_manager.get(camera_id or camera_manager.camera_ids[0])
+    if pipeline is None: abort(404)
+    return Response(pipeline.broadcaster.subscribe(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
+    logger.info("Initializing resources in the background. Starting Web Server.")
+    lifecycle.start()
     try:
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
     except KeyboardInterrupt:
         logger.info("Shutdown signal received.")
     finally:
-        vs.stop()
\ No newline at end of file
+        lifecycle.stop()
\ No newline at end of file
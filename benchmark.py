@@ -0,0 +1,202 @@
+"""
+Offline replay benchmark.
+
+Feeds a recorded video through the same detect -> track -> recognize ->
+zone -> alert stages as the live app, with alerts sent to a stub sink
+instead of the siren and ntfy. The run reports per-stage latency
+percentiles, overall fps, peak RSS and the alerts that fired, and writes
+them to a JSON file so runs can be compared across commits.
+
+    python benchmark.py --video demo/banned-person-demo.mp4 --output bench.json
+    python benchmark.py --video demo/banned-person-demo.mp4 --fps 15
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+
+from src.alerting import set_dispatcher
+from src.event_store import set_event_store
+from src.face_recognition_util import encode_face
+from src.gallery_watcher import GalleryWatcher
+from src.pipeline import CameraPipeline, FRAME_PROCESSING_INTERVAL
+from src.stage_timer import StageTimer
+from src.zones import Zone, load_zone_configs
+from src.tracking import DEFAULT_TRACKER, TRACKER_BACKENDS, initialize_tracker
+from src.detection import detect_persons
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+logger = logging.getLogger("benchmark")
+
+class StubAlertSink:
+    """Stands in for the AlertDispatcher and only records which alerts fired."""
+    def __init__(self, clock):
+        self.clock = clock
+        self.alerts = []
+
+    def submit(self, title, frame, snapshot_prefix):
+        self.alerts.append({"video_time": round(self.clock(), 3), "title": title, "prefix": snapshot_prefix})
+        return True
+
+    def stop(self):
+        pass
+
+class StubEventSink:
+    """Stands in for the EventStore and only counts events by type."""
+    def __init__(self):
+        self.counts = {}
+
+    def record(self, event_type, *args, **kwargs):
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+        return True
+
+    def stop(self):
+        pass
+
+class InlineRecognizer:
+    """
+    Drop-in for RecognitionPool that encodes faces synchronously, so every
+    run of the same video makes the same recognition decisions. The
+    encoding cost is reported as "recognize_encode" and is also part of
+    the enclosing "recognize" stage.
+    """
+    def __init__(self, timer):
+        self.timer = timer
+        self._results = {}
+
+    def submit(self, key, crop, priority):
+        with self.timer.stage("recognize_encode"):
+            self._results[key] = encode_face(crop)
+        return True
+
+    def is_pending(self, key):
+        return key in self._results
+
+    def cancel(self, keys):
+        for key in keys: self._results.pop(key, None)
+
+    def drain_results(self):
+        results, self._results = list(self._results.items()), {}
+        return results
+
+def peak_rss_mb():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_benchmark_zones(path):
+    """Zones for the replay camera: the "replay" entry of a zones file, or its only entry."""
+    if not path: return None
+    configs = load_zone_configs(path)
+    zone_list = configs.get("replay") or (next(iter(configs.values())) if len(configs) == 1 else None)
+    if not zone_list: raise SystemExit(f"No zones for camera 'replay' in {path}")
+    return [Zone.from_config(z) for z in zone_list]
+
+def run_benchmark(video, model_path, faces_dir, fps, interval, adaptive, max_frames, tracker=DEFAULT_TRACKER, zones=None):
+    from ultralytics import YOLO
+
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise SystemExit(f"Could not open video: {video}")
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    timer = StageTimer()
+    video_time = {"now": 0.0}
+    sink = StubAlertSink(lambda: video_time["now"])
+    set_dispatcher(sink)
+    events = StubEventSink()
+    set_event_store(events)
+
+    model = YOLO(model_path)
+    recognizer = InlineRecognizer(timer)
+    # Sighting images are still written (it is part of the work being timed), but not into the live directory.
+    sightings_dir = tempfile.TemporaryDirectory(prefix="benchmark_sightings_")
+    pipeline = CameraPipeline("replay", None, initialize_tracker(tracker), recognizer, GalleryWatcher(faces_dir),
+                              processing_interval=interval, adaptive=adaptive, timer=timer,
+                              zones=load_benchmark_zones(zones), sightings_dir=sightings_dir.name)
+
+    frames = processed = 0
+    frame_period = 1.0 / fps if fps else 0.0
+    start = time.perf_counter()
+    while max_frames is None or frames < max_frames:
+        with timer.stage("decode"):
+            grabbed, frame = capture.read()
+        if not grabbed: break
+        # Pipeline time follows the video clock so loiter timers behave the same at any replay speed.
+        current_time = video_time["now"] = frames / video_fps
+        frames += 1
+
+        with timer.stage("frame_total"):
+            if pipeline.due_for_inference(frame, current_time):
+                processed += 1
+                with timer.stage("detect"):
+                    detections = detect_persons(model, frame)
+                results = [(track_id, encoding) for (_, track_id), encoding in recognizer.drain_results()]
+                pipeline.process_detections(frame, detections, results, current_time)
+            with timer.stage("annotate"):
+                pipeline.annotate(frame, current_time)
+            pipeline.publish(frame, current_time)
+
+        if frame_period:
+            delay = start + frames * frame_period - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+
+    wall_seconds = time.perf_counter() - start
+    capture.release()
+    sightings_dir.cleanup()
+    return {
+        "video": video, "commit": git_commit(), "mode": "fixed_fps" if fps else "max_speed",
+        "target_fps": fps, "tracker": tracker, "zones": len(pipeline.zone_engine.zones), "frames": frames, "processed_frames": processed,
+        "wall_seconds": wall_seconds,
+        "fps": frames / wall_seconds if wall_seconds else 0.0,
+        "processed_fps": processed / wall_seconds if wall_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.summary(),
+        "scheduler": pipeline.scheduler.stats(),
+        "alerts": sink.alerts,
+        "events": events.counts,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded video through the surveillance pipeline and report timings.")
+    parser.add_argument("--video", default="demo/banned-person-demo.mp4", help="Video file to replay.")
+    parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON report.")
+    parser.add_argument("--fps", type=float, default=0.0, help="Replay at this frame rate; 0 runs as fast as possible.")
+    parser.add_argument("--interval", type=int, default=FRAME_PROCESSING_INTERVAL, help="Run detection on every Nth frame.")
+    parser.add_argument("--adaptive", action="store_true", help="Use the motion-gated adaptive scheduler (less reproducible).")
+    parser.add_argument("--max-frames", type=int, default=None, help="Stop after this many frames.")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO weights to load.")
+    parser.add_argument("--faces", default="registered_faces", help="Registered faces directory.")
+    parser.add_argument("--zones", default=None, help="zones.json to replay with (uses its 'replay' camera).")
+    parser.add_argument("--tracker", default=DEFAULT_TRACKER, choices=TRACKER_BACKENDS, help="Tracker backend to replay with.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='[%(asctime)s] - %(levelname)s - %(message)s')
+    report = run_benchmark(args.video, args.model, args.faces, args.fps, args.interval, args.adaptive, args.max_frames, args.tracker, args.zones)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['frames']} frames ({report['processed_frames']} analysed) in {report['wall_seconds']:.1f}s "
+          f"-> {report['fps']:.1f} fps, peak RSS {report['peak_rss_mb'] or 0:.0f} MB")
+    for name, stage in report["stages"].items():
+        print(f"  {name:<18} p50 {stage['p50_ms']:7.2f} ms  p95 {stage['p95_ms']:7.2f} ms  p99 {stage['p99_ms']:7.2f} ms")
+    print(f"  {len(report['alerts'])} alert(s) fired. Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
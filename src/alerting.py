@@ -1,10 +1,16 @@
 import time
 import os
 import cv2
+import json
+import queue
+import threading
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 
+from .metrics import REGISTRY
+
 try:
     import simpleaudio as sa
 except ImportError:
@@ -12,78 +18,276 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
-# --- CONFIGURATION (Unchanged) ---
+# --- CONFIGURATION ---
 SIREN_PATH = "assets/siren.wav"
 ALERT_SNAPSHOT_DIR = "alert_snapshots"
 ALERT_COOLDOWN_SECONDS = 10.0
+NTFY_SERVER = os.environ.get("NTFY_SERVER", "https://ntfy.sh")
 NTFY_TOPIC = "aiRetailSurveillance"
+# (connect, read) timeouts for the notification POST.
+NTFY_TIMEOUT_SECONDS = (3.05, 10.0)
+NTFY_MAX_ATTEMPTS = 4
+NTFY_BACKOFF_SECONDS = 0.5
+ALERT_QUEUE_SIZE = 32
+DEAD_LETTER_DIR = "alert_dead_letters"
+
+class ChannelStats:
+    """Counts deliveries, failures and latency for one alert channel."""
+    def __init__(self, channel, registry=REGISTRY):
+        self.sent = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # The dispatcher and the dead-letter replay thread both record ntfy deliveries.
+        self._lock = threading.Lock()
+        self._latency = registry.histogram("alert_dispatch_seconds", channel=channel)
+        self._failures = registry.counter("alert_failures_total", channel=channel)
+
+    def record(self, latency, ok):
+        with self._lock:
+            if ok: self.sent += 1
+            else: self.failed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        if not ok: self._failures.inc()
+        self._latency.observe(latency)
+
+    def as_dict(self):
+        attempts = self.sent + self.failed
+        return {
+            "sent": self.sent, "failed": self.failed,
+            "avg_latency_seconds": self.total_latency / attempts if attempts else 0.0,
+            "max_latency_seconds": self.max_latency,
+        }
+
+class AlertDispatcher:
+    """
+    Delivers alerts from a bounded queue on a background thread so the frame
+    loop never waits on disk, audio or the network.
+
+    Notifications go through a pooled HTTP session with timeouts and
+    exponential-backoff retries. Alerts that still fail are written to a
+    dead-letter spool on disk and re-sent the next time the dispatcher starts,
+    on a thread of their own so a backlog never delays live alerts.
+    Point `ntfy_server` at a local HTTP server to exercise it without ntfy.sh.
+    """
+    def __init__(self, ntfy_server=NTFY_SERVER, topic=NTFY_TOPIC, queue_size=ALERT_QUEUE_SIZE,
+                 snapshot_dir=ALERT_SNAPSHOT_DIR, dead_letter_dir=DEAD_LETTER_DIR,
+                 max_attempts=NTFY_MAX_ATTEMPTS, backoff_seconds=NTFY_BACKOFF_SECONDS,
+                 timeout=NTFY_TIMEOUT_SECONDS, siren_path=SIREN_PATH, registry=REGISTRY):
+        self.ntfy_url = f"{ntfy_server.rstrip('/')}/{topic}"
+        self.snapshot_dir = snapshot_dir
+        self.dead_letter_dir = dead_letter_dir
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.siren_path = siren_path
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {channel: ChannelStats(channel, registry) for channel in ("snapshot", "siren", "ntfy")}
+        self.dropped = 0
+        self._submit_latency = registry.histogram("alert_submit_seconds")
+        self._delivery_latency = registry.histogram("alert_delivery_seconds")
+        registry.gauge("alert_queue_depth", self.queue.qsize)
+        registry.gauge("alerts_dropped", lambda: self.dropped)
+        self._siren = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # --- Producer side (called from the frame loop) ---
+    def submit(self, title, frame, snapshot_prefix):
+        """Queues an alert without blocking. Returns False if the queue is full and the alert was dropped."""
+        start = time.perf_counter()
+        alert = {"title": title, "frame": frame.copy(), "prefix": snapshot_prefix, "created": start}
+        try:
+            self.queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"Alert queue full, dropped alert: {title}")
+            return False
+        finally:
+            self._submit_latency.observe(time.perf_counter() - start)
+
+    # --- Consumer side ---
+    def start(self):
+        """Starts the dispatcher thread and re-sends any spooled alerts."""
+        self._load_siren()
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._replay_dead_letters, name="alert-replay", daemon=True).start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Lets queued alerts drain, then stops the dispatcher thread."""
+        if self._thread is None: return
+        self._stopping.set()
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self.session.close()
+
+    def _run(self):
+        while True:
+            alert = self.queue.get()
+            if alert is None: break
+            try:
+                self._deliver(alert)
+            except Exception as e:
+                logger.error(f"Unexpected error while dispatching alert: {e}")
+
+    def _deliver(self, alert):
+        snapshot_filename = self._save_snapshot(alert["frame"], alert["prefix"])
+        self._play_siren()
+        if snapshot_filename:
+            self.send_phone_notification(alert["title"], snapshot_filename)
+        self._delivery_latency.observe(time.perf_counter() - alert["created"])
+
+    def _save_snapshot(self, frame, prefix):
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            snapshot_filename = os.path.join(self.snapshot_dir, f"{prefix}_{timestamp}.jpg")
+            ok = cv2.imwrite(snapshot_filename, frame)
+            self.stats["snapshot"].record(time.perf_counter() - start, ok)
+            if ok: logger.info(f"Alert snapshot saved: {snapshot_filename}")
+            return snapshot_filename if ok else ""
+        except Exception as e:
+            self.stats["snapshot"].record(time.perf_counter() - start, False)
+            logger.error(f"Could not save alert snapshot: {e}")
+            return ""
+
+    def _load_siren(self):
+        """Decodes the siren once; every alert replays the cached wave object."""
+        if sa and self._siren is None and os.path.exists(self.siren_path):
+            try: self._siren = sa.WaveObject.from_wave_file(self.siren_path)
+            except Exception as e: logger.error(f"Could not load siren sound: {e}")
 
-def send_phone_notification(title, image_path):
-    """Sends a push notification with a custom title and an image."""
-    try:
-        with open(image_path, 'rb') as image_file:
-            requests.post(
-                f"https://ntfy.sh/{NTFY_TOPIC}",
-                data=image_file,
-                headers={
-                    "Title": title, # MODIFIED: Use custom title
-                    "Priority": "high", "Tags": "warning,person",
-                    "Filename": os.path.basename(image_path)
-                }
-            )
-        logger.info(f"Notification sent to ntfy topic: {NTFY_TOPIC}")
-    except Exception as e:
-        logger.error(f"Could not send notification: {e}")
+    def _play_siren(self):
+        start = time.perf_counter()
+        if self._siren is None:
+            print("\a" * 3)
+            return
+        try:
+            self._siren.play()
+            self.stats["siren"].record(time.perf_counter() - start, True)
+        except Exception as e:
+            self.stats["siren"].record(time.perf_counter() - start, False)
+            logger.error(f"Could not play siren sound: {e}")
+
+    def send_phone_notification(self, title, image_path):
+        """Sends a push notification with retries; spools it to disk if every attempt fails."""
+        start = time.perf_counter()
+        try:
+            with open(image_path, 'rb') as image_file:
+                payload = image_file.read()
+        except OSError as e:
+            self.stats["ntfy"].record(time.perf_counter() - start, False)
+            logger.error(f"Could not read snapshot for notification: {e}")
+            return False
+
+        headers = {
+            "Title": title,
+            "Priority": "high", "Tags": "warning,person",
+            "Filename": os.path.basename(image_path)
+        }
+        error = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            try:
+                response = self.session.post(self.ntfy_url, data=payload, headers=headers, timeout=self.timeout)
+                if response.ok:
+                    self.stats["ntfy"].record(time.perf_counter() - start, True)
+                    logger.info(f"Notification sent to {self.ntfy_url}")
+                    return True
+                error = f"HTTP {response.status_code}"
+                # Client errors other than rate limiting will not succeed on retry.
+                if response.status_code < 500 and response.status_code != 429: break
+            except requests.RequestException as e:
+                error = str(e)
+
+        self.stats["ntfy"].record(time.perf_counter() - start, False)
+        logger.error(f"Could not send notification after {attempt + 1} attempt(s): {error}")
+        self._spool(title, image_path, error)
+        return False
+
+    def _spool(self, title, image_path, error):
+        try:
+            os.makedirs(self.dead_letter_dir, exist_ok=True)
+            spool_path = os.path.join(self.dead_letter_dir, f"{time.time_ns()}.json")
+            with open(spool_path, 'w') as f:
+                json.dump({"title": title, "image_path": image_path, "error": error, "spooled_at": time.time()}, f)
+        except OSError as e:
+            logger.error(f"Could not spool failed notification: {e}")
+
+    def _replay_dead_letters(self):
+        if not os.path.isdir(self.dead_letter_dir): return
+        # Listed once: letters that fail again are re-spooled and wait for the next start.
+        for filename in sorted(os.listdir(self.dead_letter_dir)):
+            if self._stopping.is_set(): return
+            spool_path = os.path.join(self.dead_letter_dir, filename)
+            try:
+                with open(spool_path) as f:
+                    letter = json.load(f)
+                os.remove(spool_path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping unreadable dead letter {spool_path}: {e}")
+                continue
+            logger.info(f"Re-sending spooled notification: {letter['title']}")
+            # A failed re-send is spooled again under a new name.
+            self.send_phone_notification(letter["title"], letter["image_path"])
+
+    def stats_snapshot(self):
+        """Returns per-channel counters plus queue depth and drops."""
+        snapshot = {name: stats.as_dict() for name, stats in self.stats.items()}
+        snapshot.update({"queue_depth": self.queue.qsize(), "dropped": self.dropped})
+        return snapshot
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    """Returns the process-wide alert dispatcher, starting it on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher().start()
+        return _dispatcher
+
+def set_dispatcher(dispatcher):
+    """Replaces the process-wide dispatcher, e.g. with a sink that only records alerts."""
+    global _dispatcher
+    with _dispatcher_lock:
+        _dispatcher = dispatcher
+
+def _camera_suffix(camera_id):
+    return f" on camera '{camera_id}'" if camera_id is not None else ""
+
+def _zone_text(zone):
+    return "restricted zone" if zone is None else f"zone '{zone}'"
+
+def _prefix(base, camera_id, zone):
+    return "_".join(str(part) for part in (base, camera_id, zone) if part is not None)
 
 # --- NEW: Alert function specifically for Banned Persons ---
-def trigger_banned_person_alert(frame, person_name):
+def trigger_banned_person_alert(frame, person_name, camera_id=None, zone=None):
     """Triggers an immediate alert for a banned person."""
-    logger.critical(f"BANNED PERSON ALERT: '{person_name}' detected in restricted zone!")
-
-    snapshot_filename = ""
-    try:
-        if not os.path.exists(ALERT_SNAPSHOT_DIR): os.makedirs(ALERT_SNAPSHOT_DIR)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        snapshot_filename = os.path.join(ALERT_SNAPSHOT_DIR, f"banned_{person_name}_{timestamp}.jpg")
-        cv2.imwrite(snapshot_filename, frame)
-        logger.info(f"Banned person snapshot saved: {snapshot_filename}")
-    except Exception as e:
-        logger.error(f"Could not save banned person snapshot: {e}")
-
-    # Play siren
-    if sa and os.path.exists(SIREN_PATH):
-        try: sa.WaveObject.from_wave_file(SIREN_PATH).play()
-        except Exception as e: logger.error(f"Could not play siren sound: {e}")
-    else: print("\a" * 3)
-    
-    # Send notification
-    if snapshot_filename:
-        notification_title = f"BANNED PERSON: {person_name} Detected!"
-        send_phone_notification(notification_title, snapshot_filename)
+    logger.critical(f"BANNED PERSON ALERT: '{person_name}' detected in {_zone_text(zone)}{_camera_suffix(camera_id)}!")
+    get_dispatcher().submit(f"BANNED PERSON: {person_name} Detected!", frame, _prefix(f"banned_{person_name}", camera_id, zone))
 
 # --- Loitering Alert (largely unchanged) ---
-def trigger_alert(frame, last_alert_time):
-    """Triggers a loitering alert for an unknown person."""
-    current_time = time.time()
+def trigger_alert(frame, last_alert_time, camera_id=None, now=None, zone=None, person_name="Unknown"):
+    """Triggers a loitering alert, e.g. for an unknown person. `now` overrides the clock, e.g. for video replay."""
+    current_time = time.time() if now is None else now
     if (current_time - last_alert_time) > ALERT_COOLDOWN_SECONDS:
-        logger.critical("LOITERING ALERT: Unknown person in restricted zone.")
-        
-        snapshot_filename = ""
-        try:
-            if not os.path.exists(ALERT_SNAPSHOT_DIR): os.makedirs(ALERT_SNAPSHOT_DIR)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            snapshot_filename = os.path.join(ALERT_SNAPSHOT_DIR, f"loitering_alert_{timestamp}.jpg")
-            cv2.imwrite(snapshot_filename, frame)
-            logger.info(f"Loitering snapshot saved: {snapshot_filename}")
-        except Exception as e: logger.error(f"Could not save loitering snapshot: {e}")
-
-        if sa and os.path.exists(SIREN_PATH):
-            try: sa.WaveObject.from_wave_file(SIREN_PATH).play()
-            except Exception as e: logger.error(f"Could not play siren sound: {e}")
-        else: print("\a" * 3)
-        
-        if snapshot_filename:
-            send_phone_notification("Loitering Alert: Unknown Person!", snapshot_filename)
-
+        who = "Unknown person" if person_name == "Unknown" else f"'{person_name}'"
+        logger.critical(f"LOITERING ALERT: {who} in {_zone_text(zone)}{_camera_suffix(camera_id)}.")
+        title = "Loitering Alert: Unknown Person!" if person_name == "Unknown" else f"Loitering Alert: {person_name}!"
+        get_dispatcher().submit(title, frame, _prefix("loitering_alert", camera_id, zone))
         return current_time
-    return last_alert_time
\ No newline at end of file
+    return last_alert_time
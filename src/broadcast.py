@@ -0,0 +1,49 @@
+import threading
+
+class FrameBroadcaster:
+    """
+    Holds the most recent encoded frame produced by the analysis pipeline and
+    hands it to any number of MJPEG subscribers.
+
+    The pipeline publishes each frame exactly once. Subscribers always jump to
+    the newest frame, so a slow client simply misses intermediate frames
+    instead of holding up the pipeline or the other viewers.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._chunk = None
+        self._sequence = 0
+        self._closed = False
+        self.subscriber_count = 0
+
+    def publish(self, jpeg_bytes):
+        """Stores a JPEG-encoded frame as a ready-to-send multipart chunk and wakes all subscribers."""
+        chunk = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n'
+        with self._condition:
+            self._chunk = chunk
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def subscribe(self, timeout=5.0):
+        """Generator yielding multipart chunks for one HTTP client until the broadcaster is closed."""
+        last_sequence = 0
+        with self._condition:
+            self.subscriber_count += 1
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._closed or self._sequence != last_sequence, timeout)
+                    if self._closed: return
+                    if self._sequence == last_sequence: continue
+                    chunk, last_sequence = self._chunk, self._sequence
+                # Yield outside the lock so a slow socket write never blocks the publisher.
+                yield chunk
+        finally:
+            with self._condition:
+                self.subscriber_count -= 1
+
+    def close(self):
+        """Wakes and terminates every subscriber."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from .clip_recorder import CLIP_BUFFER_MB, CLIP_POST_SECONDS, CLIP_PRE_SECONDS, ClipRecorder
+from .detection import detect_persons_batch
+from .metrics import REGISTRY
+from .reid_cache import ReIdCache
+from .pipeline import CameraPipeline, FORBIDDEN_ZONE, FRAME_PROCESSING_INTERVAL
+from .scheduler import DECISIONS
+from .tracking import DEFAULT_TRACKER, initialize_tracker
+from .video_stream import VideoStream
+from .zones import Zone
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+CAMERA_CONFIG_PATH = "cameras.json"
+DEFAULT_FRAME_WIDTH, DEFAULT_FRAME_HEIGHT = 1280, 720
+# Used when no cameras.json exists: the single local webcam the app always used.
+DEFAULT_CAMERAS = [{"id": "cam0", "source": 0}]
+
+def load_camera_configs(path=CAMERA_CONFIG_PATH):
+    """
+    Reads the list of cameras from a JSON file, falling back to the default webcam.
+
+    Each entry looks like:
+        {"id": "entrance", "source": "rtsp://10.0.0.5/stream1",
+         "width": 1280, "height": 720, "forbidden_zone": [0, 0, 350, 720]}
+    `source` may be a device index, an RTSP/HTTP URL or a local video file;
+    set "loop": true to replay a video file forever and "tracker": "iou" to
+    use the lightweight IoU tracker instead of DeepSort. Alert clips are
+    tuned with "clip_buffer_mb", "clip_pre_seconds" and "clip_post_seconds";
+    a "clip_buffer_mb" of 0 disables them. Polygon zones can be given inline
+    as "zones" or in zones.json (see src/zones.py); "forbidden_zone" is the
+    single-rectangle fallback.
+    """
+    if not os.path.exists(path):
+        return DEFAULT_CAMERAS
+    with open(path) as f:
+        configs = json.load(f)
+    ids = [c["id"] for c in configs]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate camera ids in {path}: {ids}")
+    return configs
+
+def parse_source(source):
+    """Turns "0"-style strings into device indices; URLs and file paths are passed through."""
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+def open_streams(camera_configs, start=True):
+    """Creates (and by default starts) one VideoStream per camera, so cameras can warm up before the pipeline exists."""
+    streams = {}
+    for config in camera_configs:
+        stream = VideoStream(src=parse_source(config.get("source", 0)),
+                             width=config.get("width", DEFAULT_FRAME_WIDTH),
+                             height=config.get("height", DEFAULT_FRAME_HEIGHT),
+                             loop=config.get("loop", False))
+        streams[str(config["id"])] = stream.start() if start else stream
+    return streams
+
+def create_clip_recorder(camera_id, config):
+    """Builds the camera's ClipRecorder from its config, or returns None if clips are turned off."""
+    clip_buffer_mb = config.get("clip_buffer_mb", CLIP_BUFFER_MB)
+    if not clip_buffer_mb: return None
+    return ClipRecorder(camera_id, max_bytes=clip_buffer_mb * 1024 * 1024,
+                        pre_seconds=config.get("clip_pre_seconds", CLIP_PRE_SECONDS),
+                        post_seconds=config.get("clip_post_seconds", CLIP_POST_SECONDS))
+
+class CameraManager:
+    """
+    Owns one VideoStream and one CameraPipeline per camera and drives them
+    from a single loop.
+
+    Every iteration collects the newest frame from each camera, asks each
+    camera's scheduler whether the frame needs inference, runs one batched
+    YOLO call over the cameras that do, and routes
+    each camera's detections to its own tracker and zone rules. Face
+    recognition results from the shared pool are routed back by camera id.
+
+    Streams opened beforehand with `open_streams()` can be passed in, so
+    the cameras warm up while the model is still loading.
+    """
+    def __init__(self, model, camera_configs, recognition_pool, gallery_watcher, registry=REGISTRY, zone_configs=None, streams=None):
+        self.model = model
+        self.registry = registry
+        self.recognition_pool = recognition_pool
+        self.pipelines = {}
+        self._pending_results = {}
+        self._stopped = False
+        self._thread = None
+        # Set by every stream when it captures a frame, so the loop sleeps instead of spinning.
+        self._frame_ready = threading.Event()
+        # Shared so a person's face can be re-identified when they move to another camera.
+        self.reid_cache = ReIdCache(registry=registry)
+
+        streams = streams or open_streams(camera_configs, start=False)
+        for config in camera_configs:
+            camera_id = str(config["id"])
+            stream = streams[camera_id]
+            stream.on_frame = self._frame_ready
+            recorder = self._create_recorder(camera_id, config)
+            zone_list = config.get("zones") or (zone_configs or {}).get(camera_id)
+            pipeline = CameraPipeline(
+                camera_id, stream, initialize_tracker(config.get("tracker", DEFAULT_TRACKER)), recognition_pool, gallery_watcher,
+                forbidden_zone=config.get("forbidden_zone", FORBIDDEN_ZONE),
+                processing_interval=config.get("processing_interval", FRAME_PROCESSING_INTERVAL),
+                timer=registry.timer("pipeline_stage_seconds", camera=camera_id), recorder=recorder,
+                reid_cache=self.reid_cache,
+                zones=[Zone.from_config(z) for z in zone_list] if zone_list else None)
+            self.pipelines[camera_id] = pipeline
+            self._pending_results[camera_id] = []
+            self._register_camera_metrics(pipeline)
+
+        # Detection is batched across cameras, so it is timed once per batch.
+        self._batch_timer = registry.timer("pipeline_stage_seconds", camera="all")
+        registry.gauge("recognition_queue_depth", recognition_pool.queue_depth)
+        registry.gauge("recognition_requests_dropped", lambda: recognition_pool.dropped)
+
+    def _create_recorder(self, camera_id, config):
+        return create_clip_recorder(camera_id, config)
+
+    def _register_camera_metrics(self, pipeline):
+        registry, camera_id, stream = self.registry, pipeline.camera_id, pipeline.stream
+        stream.capture_counter = registry.counter("frames_captured_total", camera=camera_id)
+        pipeline.processed_counter = registry.counter("frames_processed_total", camera=camera_id)
+        pipeline.published_counter = registry.counter("frames_published_total", camera=camera_id)
+        registry.gauge("frames_dropped", lambda: stream.frames_dropped, camera=camera_id)
+        registry.gauge("stream_reconnects", lambda: stream.reconnects, camera=camera_id)
+        registry.gauge("active_tracks", lambda: len(pipeline.tracked_persons), camera=camera_id)
+        registry.gauge("stream_viewers", lambda: pipeline.broadcaster.subscriber_count, camera=camera_id)
+        registry.gauge("inference_interval_frames", lambda: pipeline.scheduler.interval, camera=camera_id)
+        scheduler = pipeline.scheduler
+        scheduler.decision_counters = {decision: registry.counter("inference_decisions_total", camera=camera_id, decision=decision)
+                                       for decision in DECISIONS}
+        scheduler.saved_counter = registry.counter("inference_seconds_saved_total", camera=camera_id)
+        registry.gauge("tracks_in_zones", lambda: sum(1 for p in list(pipeline.tracked_persons.values()) if p["zones"]), camera=camera_id)
+        recorder = pipeline.recorder
+        if recorder:
+            registry.gauge("clip_buffer_bytes", lambda: recorder.buffer_bytes, camera=camera_id)
+            registry.gauge("clip_buffer_limit_bytes", lambda: recorder.max_bytes, camera=camera_id)
+            registry.gauge("clips_written", lambda: recorder.clips_written, camera=camera_id)
+            registry.gauge("clips_failed", lambda: recorder.clips_failed + recorder.clips_dropped, camera=camera_id)
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def camera_ids(self):
+        return list(self.pipelines)
+
+    def get(self, camera_id):
+        return self.pipelines.get(camera_id)
+
+    def start(self):
+        """Starts every camera stream and the shared analysis loop."""
+        for pipeline in self.pipelines.values():
+            if not pipeline.stream.started:
+                logger.info(f"Starting video stream for camera '{pipeline.camera_id}'...")
+                pipeline.stream.start()
+        # Pre-started streams may already hold frames.
+        self._frame_ready.set()
+        self._thread = threading.Thread(target=self.run, name="analysis-pipeline", daemon=True)
+        self._thread.start()
+        return self
+
+    def _route_recognition_results(self):
+        for (camera_id, track_id), encoding in self.recognition_pool.drain_results():
+            if camera_id in self._pending_results:
+                self._pending_results[camera_id].append((track_id, encoding))
+
+    def run(self):
+        """Runs detection, tracking, recognition and alerting for all cameras and publishes annotated frames."""
+        while not self._stopped:
+            self._frame_ready.wait(timeout=0.5)
+            self._frame_ready.clear()
+            current_time = time.time()
+            frames = {}
+            for camera_id, pipeline in self.pipelines.items():
+                item = pipeline.stream.read_next(timeout=0)
+                if item is not None: frames[camera_id] = item
+            if not frames:
+                if all(p.stream.ended for p in self.pipelines.values()): break
+                continue
+
+            self._route_recognition_results()
+            due = [p for cid, p in self.pipelines.items() if cid in frames and p.due_for_inference(frames[cid][0], current_time)]
+            if due:
+                inference_start = time.perf_counter()
+                with self._batch_timer.stage("detect"):
+                    batch_detections = detect_persons_batch(self.model, [frames[p.camera_id][0] for p in due])
+                inference_seconds = time.perf_counter() - inference_start
+                for pipeline, detections in zip(due, batch_detections):
+                    results, self._pending_results[pipeline.camera_id] = self._pending_results[pipeline.camera_id], []
+                    pipeline.process_detections(frames[pipeline.camera_id][0], detections, results, current_time)
+                    pipeline.processed_counter.inc()
+
+            for camera_id, (frame, _, _) in frames.items():
+                pipeline = self.pipelines[camera_id]
+                with pipeline.timer.stage("annotate"):
+                    pipeline.annotate(frame, current_time)
+                self._publish(pipeline, frame, current_time)
+
+            for pipeline in due:
+                capture_time = frames[pipeline.camera_id][2]
+                pipeline.scheduler.record(time.time() - capture_time, inference_seconds)
+
+        logger.warning("Video streams ended. Analysis pipeline stopped.")
+        for pipeline in self.pipelines.values():
+            pipeline.broadcaster.close()
+
+    def _publish(self, pipeline, frame, current_time):
+        """Encodes the annotated frame for viewers; the sharded pipeline hands it to an encode process instead."""
+        pipeline.publish(frame, current_time)
+        pipeline.published_counter.inc()
+
+    def stats(self):
+        """Returns per-camera capture and scheduling statistics."""
+        return {
+            camera_id: {
+                "stream": pipeline.stream.stats(),
+                "capture_fps": pipeline.stream.capture_counter.rate(),
+                "processed_fps": pipeline.processed_counter.rate(),
+                "published_fps": pipeline.published_counter.rate(),
+                "scheduler": pipeline.scheduler.stats(),
+                "tracked_persons": len(pipeline.tracked_persons),
+                "viewers": pipeline.broadcaster.subscriber_count,
+                "clips": pipeline.recorder.stats() if pipeline.recorder else None,
+            }
+            for camera_id, pipeline in self.pipelines.items()
+        }
+
+    def stop(self):
+        self._stopped = True
+        for pipeline in self.pipelines.values():
+            pipeline.broadcaster.close()
+            pipeline.stream.stop()
+            if pipeline.recorder: pipeline.recorder.stop()
@@ -0,0 +1,215 @@
+import collections
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+ALERT_CLIP_DIR = "alert_clips"
+CLIP_PRE_SECONDS = 10.0
+CLIP_POST_SECONDS = 10.0
+# Upper bound on the JPEG bytes one camera's recorder holds: the pre-roll plus
+# clips still recording or waiting to be written. A 720p frame is roughly
+# 60-120 KB, so 64 MB covers a 10 s + 10 s clip at 30 fps of ~100 KB frames.
+CLIP_BUFFER_MB = 64
+CLIP_FOURCC = "mp4v"
+CLIP_WRITE_QUEUE_SIZE = 8
+
+class _Recording:
+    __slots__ = ("prefix", "frames", "end_time", "pre_count", "pre_bytes", "post_bytes", "full",
+                 "evicted_index", "evicted_bytes")
+
+    def __init__(self, prefix, frames, end_time):
+        self.prefix = prefix
+        self.frames = collections.deque(frames)
+        self.end_time = end_time
+        self.pre_count = len(self.frames)
+        self.pre_bytes = sum(len(jpeg) for _, jpeg in self.frames)
+        self.post_bytes = 0
+        # Set once the budget stops the post-roll early.
+        self.full = False
+        # frames[:evicted_index] have left the pre-roll ring, so only this recording keeps them alive.
+        self.evicted_index = 0
+        self.evicted_bytes = 0
+
+class ClipRecorder:
+    """
+    Keeps the last few seconds of one camera as JPEG bytes and turns them
+    into an MP4 clip around each alert.
+
+    `add()` only appends a reference to the JPEG the broadcaster already
+    encoded. `trigger()` snapshots the pre-roll and keeps collecting frames
+    for `post_seconds`; an alert that fires while a clip is still recording
+    extends that clip instead of starting a second one. Decoding and MP4
+    encoding happen on a background thread.
+
+    `max_bytes` bounds everything the recorder holds: the pre-roll ring and
+    the frames that only clips still recording or waiting to be written keep
+    alive (`buffer_bytes`). Over budget, the ring gives up its oldest frames
+    first; then a clip in progress drops its oldest pre-roll frames, but only
+    while its pre-roll is larger than its post-roll, and otherwise stops its
+    post-roll early.
+    """
+    def __init__(self, camera_id, max_bytes=CLIP_BUFFER_MB * 1024 * 1024, pre_seconds=CLIP_PRE_SECONDS,
+                 post_seconds=CLIP_POST_SECONDS, clip_dir=ALERT_CLIP_DIR):
+        self.camera_id = camera_id
+        self.max_bytes = int(max_bytes)
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.clip_dir = clip_dir
+
+        self._frames = collections.deque()
+        self._ring_bytes = 0
+        self._recording = None
+        # Clips recording, queued or being written, whose evicted frames count towards the budget.
+        self._live = []
+        self._lock = threading.Lock()
+        self.clips_written = 0
+        self.clips_failed = 0
+        self.clips_dropped = 0
+        self._queue = queue.Queue(maxsize=CLIP_WRITE_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name=f"clip-writer-{camera_id}", daemon=True)
+        self._thread.start()
+
+    @property
+    def buffer_bytes(self):
+        """JPEG bytes held in the pre-roll ring or only by unwritten clips."""
+        return self._ring_bytes + sum(r.evicted_bytes for r in self._live)
+
+    # --- Producer side (analysis loop) ---
+    def add(self, jpeg_bytes, timestamp):
+        """Appends an encoded frame; finishes the current clip once its post-roll is complete."""
+        with self._lock:
+            frame = (timestamp, jpeg_bytes)
+            self._frames.append(frame)
+            self._ring_bytes += len(jpeg_bytes)
+            recording = self._recording
+            if recording is not None and not recording.full:
+                recording.frames.append(frame)
+                recording.post_bytes += len(jpeg_bytes)
+
+            frames = self._frames
+            while frames and timestamp - frames[0][0] > self.pre_seconds:
+                self._evict_oldest()
+            while frames and self.buffer_bytes > self.max_bytes:
+                self._evict_oldest()
+            if recording is not None: self._trim(recording)
+
+            if recording is None: return
+            if timestamp >= recording.end_time:
+                self._recording = None
+                self._enqueue(recording)
+
+    def _evict_oldest(self):
+        timestamp, jpeg = self._frames.popleft()
+        self._ring_bytes -= len(jpeg)
+        # Frames that a clip still holds stay in memory: they now count against that clip.
+        for recording in self._live:
+            frames = recording.frames
+            while recording.evicted_index < len(frames) and frames[recording.evicted_index][0] <= timestamp:
+                recording.evicted_bytes += len(frames[recording.evicted_index][1])
+                recording.evicted_index += 1
+
+    def _trim(self, recording):
+        """Brings the recorder back within budget at the expense of the clip in progress."""
+        frames = recording.frames
+        while self.buffer_bytes > self.max_bytes and recording.pre_count and recording.pre_bytes > recording.post_bytes:
+            _, jpeg = frames.popleft()
+            recording.pre_count -= 1
+            recording.pre_bytes -= len(jpeg)
+            if recording.evicted_index:
+                recording.evicted_index -= 1
+                recording.evicted_bytes -= len(jpeg)
+        if self.buffer_bytes > self.max_bytes and len(frames) > recording.pre_count:
+            # Even the pre-roll/post-roll split does not fit: end the post-roll with the frames it has.
+            _, jpeg = frames.pop()
+            recording.post_bytes -= len(jpeg)
+            if recording.evicted_index > len(frames):
+                recording.evicted_index -= 1
+                recording.evicted_bytes -= len(jpeg)
+            recording.full = True
+
+    def trigger(self, prefix, now):
+        """Starts a clip with the buffered pre-roll, or extends the one already recording."""
+        with self._lock:
+            if self._recording is not None:
+                self._recording.end_time = now + self.post_seconds
+                return
+            self._recording = _Recording(prefix, self._frames, now + self.post_seconds)
+            self._live.append(self._recording)
+
+    def _enqueue(self, recording):
+        """Hands a finished clip to the writer thread. Called with the lock held."""
+        if not recording.frames:
+            # Earlier clips still waiting to be written hold the whole budget.
+            self._live.remove(recording)
+            self.clips_dropped += 1
+            logger.error(f"[{self.camera_id}] Clip buffer is full, dropped clip '{recording.prefix}'.")
+            return
+        try:
+            self._queue.put_nowait(recording)
+        except queue.Full:
+            self._live.remove(recording)
+            self.clips_dropped += 1
+            logger.error(f"[{self.camera_id}] Clip writer is behind, dropped clip '{recording.prefix}'.")
+
+    # --- Consumer side (writer thread) ---
+    def _run(self):
+        while True:
+            recording = self._queue.get()
+            if recording is None: break
+            try:
+                if self._write_clip(recording): self.clips_written += 1
+                else: self.clips_failed += 1
+            finally:
+                with self._lock:
+                    self._live.remove(recording)
+
+    def _write_clip(self, recording):
+        frames = recording.frames
+        if not frames: return False
+        duration = frames[-1][0] - frames[0][0]
+        fps = min(max((len(frames) - 1) / duration, 1.0), 60.0) if duration > 0 else 10.0
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        clip_filename = os.path.join(self.clip_dir, f"{recording.prefix}_{timestamp}.mp4")
+        writer = None
+        try:
+            os.makedirs(self.clip_dir, exist_ok=True)
+            for _, jpeg in frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None: continue
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(clip_filename, cv2.VideoWriter_fourcc(*CLIP_FOURCC), fps, (width, height))
+                    if not writer.isOpened():
+                        logger.error(f"[{self.camera_id}] Could not open clip writer for {clip_filename}.")
+                        return False
+                writer.write(frame)
+        except Exception as e:
+            logger.error(f"[{self.camera_id}] Could not write alert clip: {e}")
+            return False
+        finally:
+            if writer is not None: writer.release()
+        if writer is None: return False
+        logger.info(f"Alert clip saved: {clip_filename} ({len(frames)} frames, {duration:.1f}s)")
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"buffer_bytes": self.buffer_bytes, "buffered_frames": len(self._frames),
+                    "recording": self._recording is not None, "clips_written": self.clips_written,
+                    "clips_failed": self.clips_failed, "clips_dropped": self.clips_dropped}
+
+    def stop(self, timeout=10.0):
+        """Finishes any clip in progress with the frames it has and waits for pending writes."""
+        with self._lock:
+            recording, self._recording = self._recording, None
+            if recording is not None: self._enqueue(recording)
+        self._queue.put(None)
+        self._thread.join(timeout)
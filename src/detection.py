@@ -1,3 +1,15 @@
+def _to_tracker_detections(result):
+    """Converts one YOLO result into the [([x, y, w, h], confidence, class_id), ...] format DeepSort expects."""
+    detections_for_tracker = []
+    if result is not None and result.boxes:
+        for box in result.boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            w, h = x2 - x1, y2 - y1
+            confidence = float(box.conf[0])
+            # The class_id is always 0 since we filtered for it.
+            detections_for_tracker.append(([x1, y1, w, h], confidence, 0))
+    return detections_for_tracker
+
 def detect_persons(model, frame):
     """
     Detects persons in a frame using the provided YOLO model.
@@ -10,17 +22,25 @@ def detect_persons(model, frame):
         list: A list of detections formatted for the DeepSort tracker.
               Format: [([x, y, w, h], confidence, class_id), ...]
     """
-    # Predict objects in the frame, filtering for 'person' class (ID 0)
+    return detect_persons_batch(model, [frame])[0]
+
+def detect_persons_batch(model, frames):
+    """
+    Detects persons in several frames (e.g. one per camera) with a single
+    batched YOLO call.
+
+    Args:
+        model: The loaded YOLOv8 model instance.
+        frames (list): Video frames to process; they may differ in size.
+
+    Returns:
+        list: One detection list per input frame, in the same order and
+              format as `detect_persons`.
+    """
+    if not frames:
+        return []
+
+    # Predict objects in the frames, filtering for 'person' class (ID 0)
     # with a confidence threshold of 0.5.
-    results = model.predict(frame, classes=[0], conf=0.5, verbose=False)
-    
-    detections_for_tracker = []
-    if results and results[0].boxes:
-        for box in results[0].boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            w, h = x2 - x1, y2 - y1
-            confidence = float(box.conf[0])
-            # The class_id is always 0 since we filtered for it.
-            detections_for_tracker.append(([x1, y1, w, h], confidence, 0))
-            
-    return detections_for_tracker
\ No newline at end of file
+    results = model.predict(list(frames), classes=[0], conf=0.5, verbose=False)
+    return [_to_tracker_detections(results[i] if results and i < len(results) else None) for i in range(len(frames))]
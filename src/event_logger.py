@@ -1,11 +1,21 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "events.log")
 
 def setup_logger():
-    """Configures the logger to write to a file and the console."""
+    """
+    Configures the logger to write to a file and the console.
+
+    Callers only put records on an in-memory queue; a QueueListener thread
+    does the actual file and console writes, so logging never blocks the
+    video thread on disk I/O. Structured events (tracks, identities, zone
+    entries and alerts) go to the event store instead; see src/event_store.py.
+    """
     # Create log directory if it doesn't exist
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
@@ -14,11 +24,15 @@ def setup_logger():
     logger = logging.getLogger()
     logger.setLevel(logging.INFO) # Set the lowest level of messages to handle
 
+    # Check if handlers already exist to avoid duplicate logs
+    if logger.handlers:
+        return logger
+
     # Create a file handler to write to events.log
     # This handler will write all messages (INFO and above)
     file_handler = logging.FileHandler(LOG_FILE)
     file_handler.setLevel(logging.INFO)
-    
+
     # Create a console handler to print to the terminal
     # This handler will also write all messages (INFO and above)
     console_handler = logging.StreamHandler()
@@ -29,10 +43,12 @@ def setup_logger():
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    # Add the handlers to the logger
-    # Check if handlers already exist to avoid duplicate logs
-    if not logger.handlers:
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+    # The root logger only enqueues; the listener thread owns the slow handlers.
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Flush what is still queued when the process exits.
+    atexit.register(listener.stop)
 
-    return logger
\ No newline at end of file
+    return logger
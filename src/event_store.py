@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+EVENT_DB_PATH = os.path.join("logs", "events.db")
+EVENT_QUEUE_SIZE = 10000
+EVENT_BATCH_SIZE = 500
+EVENT_FLUSH_SECONDS = 0.5
+EVENT_RETENTION_DAYS = 30
+COMPACTION_INTERVAL_SECONDS = 3600.0
+COMPACTION_CHUNK_ROWS = 5000
+QUERY_MAX_LIMIT = 1000
+
+# Event types written by the pipeline.
+EVENT_TRACK_START = "track_start"
+EVENT_IDENTITY = "identity"
+EVENT_ZONE_ENTER = "zone_enter"
+EVENT_ZONE_EXIT = "zone_exit"
+EVENT_ALERT = "alert"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    camera_id TEXT,
+    event_type TEXT NOT NULL,
+    track_id TEXT,
+    name TEXT,
+    status TEXT,
+    zone TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events (camera_id, ts);
+CREATE INDEX IF NOT EXISTS idx_events_status_ts ON events (status, ts);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (event_type, ts);
+CREATE INDEX IF NOT EXISTS idx_events_track ON events (camera_id, track_id);
+"""
+_COLUMNS = ("ts", "camera_id", "event_type", "track_id", "name", "status", "zone", "details")
+# Filters accepted by query() and count(), mapped to their SQL conditions.
+_FILTERS = {
+    "start": "ts >= ?", "end": "ts < ?", "camera_id": "camera_id = ?", "event_type": "event_type = ?",
+    "status": "status = ?", "track_id": "track_id = ?", "zone": "zone = ?", "name": "name = ?",
+}
+
+class EventStore:
+    """
+    Structured event log in a local SQLite database.
+
+    `record()` only puts a tuple on a bounded queue, so the frame loop never
+    touches the disk. A writer thread owns the database connection, inserts
+    queued events in batched transactions (WAL mode, so readers are never
+    blocked) and periodically deletes events older than the retention
+    period. Queries open their own read-only connection and paginate by
+    descending id, passing the last id back as a cursor.
+    """
+    def __init__(self, path=EVENT_DB_PATH, retention_days=EVENT_RETENTION_DAYS, queue_size=EVENT_QUEUE_SIZE,
+                 batch_size=EVENT_BATCH_SIZE, flush_seconds=EVENT_FLUSH_SECONDS, registry=REGISTRY):
+        self.path = path
+        self.retention_seconds = retention_days * 86400.0
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._thread = None
+        self._last_compaction = 0.0
+        registry.gauge("event_queue_depth", self.queue.qsize)
+        registry.gauge("events_dropped", lambda: self.dropped)
+        registry.gauge("events_written", lambda: self.written)
+
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        # Create the schema up front so queries work before the first event is written.
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # --- Producer side (called from the frame loop) ---
+    def record(self, event_type, camera_id=None, track_id=None, name=None, status=None, zone=None, ts=None, **details):
+        """Queues one event without blocking. Extra keyword arguments are stored as JSON details."""
+        row = (time.time() if ts is None else ts, camera_id, event_type,
+               None if track_id is None else str(track_id), name, status, zone,
+               json.dumps(details) if details else None)
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    # --- Consumer side ---
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="event-store-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Writes whatever is still queued, then stops the writer thread."""
+        if self._thread is None: return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                batch = []
+                try:
+                    row = self.queue.get(timeout=self.flush_seconds)
+                    if row is None: stopping = True
+                    else: batch.append(row)
+                    while not stopping and len(batch) < self.batch_size:
+                        row = self.queue.get_nowait()
+                        if row is None: stopping = True
+                        else: batch.append(row)
+                except queue.Empty:
+                    pass
+                if batch: self._write(conn, batch)
+                if time.time() - self._last_compaction >= COMPACTION_INTERVAL_SECONDS:
+                    self.compact(conn)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(f"INSERT INTO events ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})", batch)
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            self.dropped += len(batch)
+            logger.error(f"Could not write {len(batch)} events: {e}")
+
+    def compact(self, conn=None):
+        """Deletes events older than the retention period in small chunks. Returns the number removed."""
+        self._last_compaction = time.time()
+        if self.retention_seconds <= 0: return 0
+        own_connection = conn is None
+        conn = conn or self._connect()
+        cutoff, removed = time.time() - self.retention_seconds, 0
+        try:
+            while True:
+                # Chunked so the writer never holds the lock long enough to stall readers.
+                with conn:
+                    deleted = conn.execute(
+                        "DELETE FROM events WHERE id IN (SELECT id FROM events WHERE ts < ? LIMIT ?)",
+                        (cutoff, COMPACTION_CHUNK_ROWS)).rowcount
+                removed += deleted
+                if deleted < COMPACTION_CHUNK_ROWS: break
+            if removed:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                logger.info(f"Event store compaction removed {removed} events older than {self.retention_seconds / 86400:.0f} days.")
+        except sqlite3.Error as e:
+            logger.error(f"Event store compaction failed: {e}")
+        finally:
+            if own_connection: conn.close()
+        return removed
+
+    # --- Queries ---
+    def _where(self, filters):
+        unknown = set(filters) - set(_FILTERS)
+        if unknown: raise ValueError(f"Unknown event filters: {sorted(unknown)}")
+        clauses, params = [], []
+        for key, value in filters.items():
+            if value is None: continue
+            clauses.append(_FILTERS[key])
+            params.append(value)
+        return clauses, params
+
+    def _read(self, sql, params):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10.0)
+        try:
+            conn.row_factory = sqlite3.Row
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def query(self, limit=100, cursor=None, **filters):
+        """
+        Returns the newest events matching the filters.
+
+        Args:
+            limit (int): Page size, capped at QUERY_MAX_LIMIT.
+            cursor (int): `next_cursor` from the previous page.
+            **filters: Any of start, end (epoch seconds), camera_id,
+                       event_type, status, track_id, zone, name.
+
+        Returns:
+            dict: {"events": [...], "next_cursor": int or None}
+        """
+        limit = max(1, min(int(limit), QUERY_MAX_LIMIT))
+        clauses, params = self._where(filters)
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(int(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._read(f"SELECT id, {', '.join(_COLUMNS)} FROM events {where} ORDER BY id DESC LIMIT ?", params + [limit])
+        events = []
+        for row in rows:
+            event = dict(row)
+            event["details"] = json.loads(event["details"]) if event["details"] else {}
+            events.append(event)
+        return {"events": events, "next_cursor": events[-1]["id"] if len(events) == limit else None}
+
+    def count(self, **filters):
+        """Counts the events matching the same filters as `query()`."""
+        clauses, params = self._where(filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._read(f"SELECT COUNT(*) FROM events {where}", params)[0][0]
+
+    def stats_snapshot(self):
+        return {"queue_depth": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_event_store():
+    """Returns the process-wide event store, starting it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EventStore().start()
+        return _store
+
+def set_event_store(store):
+    """Replaces the process-wide event store, e.g. with a sink that only counts events."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,184 @@
+import contextlib
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+FACE_CACHE_DIR = "face_cache"
+ENCODINGS_FILE = "encodings.npy"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "cache.lock"
+CACHE_VERSION = 1
+# Below this many misses a process pool costs more to start than it saves.
+MIN_MISSES_FOR_POOL = 4
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _encode_image(path):
+    """
+    Encodes the first face in an image file. Runs inside pool workers.
+    Returns (encodings, None), or (None, error message) if the file cannot be read.
+    """
+    import face_recognition
+    try:
+        image = face_recognition.load_image_file(path)
+        encodings = face_recognition.face_encodings(image)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    return np.asarray(encodings[:1], dtype=np.float32).reshape(-1, 128), None
+
+class FaceEncodingCache:
+    """
+    Persists reference face encodings between runs.
+
+    Encodings are stored in a single .npy matrix that is memory-mapped on
+    load, next to a JSON manifest keyed by image path that records each
+    file's mtime, size, content hash and row range. Unchanged images are
+    served from the cache; an image that was only moved or touched is
+    recognized by its content hash and is not re-encoded either. Several
+    processes (e.g. the analysis shards) may share one cache: updates are
+    serialized with a file lock, so the later ones find the encodings the
+    first one stored.
+    """
+    def __init__(self, cache_dir=FACE_CACHE_DIR, max_workers=None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.encodings_path = os.path.join(cache_dir, ENCODINGS_FILE)
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+        self.lock_path = os.path.join(cache_dir, LOCK_FILE)
+        self.last_stats = {"hits": 0, "misses": 0, "removed": 0}
+
+    def _load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") != CACHE_VERSION:
+                return {}, None
+            encodings = np.load(self.encodings_path, mmap_mode='r')
+            return manifest["entries"], encodings
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.manifest_path):
+                logger.warning(f"Ignoring unreadable face cache: {e}")
+            return {}, None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds an exclusive lock on the cache directory across processes."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _save(self, entries, rows):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        matrix = np.concatenate(rows) if rows else np.empty((0, 128), dtype=np.float32)
+        # Write to temporary files and swap them in so a crash never leaves a half-written cache.
+        tmp_encodings = f"{self.encodings_path}.{os.getpid()}.tmp"
+        tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_encodings, 'wb') as f:
+            np.save(f, matrix.astype(np.float32, copy=False))
+        with open(tmp_manifest, 'w') as f:
+            json.dump({"version": CACHE_VERSION, "entries": entries}, f)
+        os.replace(tmp_encodings, self.encodings_path)
+        os.replace(tmp_manifest, self.manifest_path)
+
+    def _encode_misses(self, paths):
+        if len(paths) < MIN_MISSES_FOR_POOL:
+            return [_encode_image(p) for p in paths]
+        # Spawned, not forked: the gallery is reloaded from a threaded process.
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(_encode_image, paths, chunksize=4))
+
+    def encode(self, paths):
+        """
+        Returns {path: (count, 128) float32 array} for every image path,
+        re-encoding only new or changed files and refreshing the cache on disk.
+        Images that cannot be read are logged and left out (and not cached, so
+        they are retried on the next call).
+        """
+        with self._locked():
+            return self._encode(paths)
+
+    def _encode(self, paths):
+        old_entries, old_encodings = self._load()
+        by_hash = {entry["sha1"]: entry for entry in old_entries.values()}
+
+        results, entries, misses, miss_hashes = {}, {}, [], {}
+        dirty = False
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning(f"Skipping face image {path}: {e}")
+                continue
+            entry = old_entries.get(path)
+            if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                # Path is new or the file was touched: fall back to its content hash.
+                dirty = True
+                try:
+                    sha1 = _file_sha1(path)
+                except OSError as e:
+                    # Deleted or replaced since the stat above.
+                    logger.warning(f"Skipping face image {path}: {e}")
+                    continue
+                entry = by_hash.get(sha1)
+            else:
+                sha1 = entry["sha1"]
+
+            if entry is None or old_encodings is None:
+                misses.append(path)
+                miss_hashes[path] = sha1
+                continue
+            start, count = entry["row"], entry["count"]
+            results[path] = np.array(old_encodings[start:start + count])
+            entries[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": sha1}
+
+        failed = 0
+        for path, (encodings, error) in zip(misses, self._encode_misses(misses)):
+            if error is None:
+                try: stat = os.stat(path)
+                except OSError as e: error = str(e)
+            if error is not None:
+                logger.warning(f"Skipping unreadable face image {path}: {error}")
+                failed += 1
+                continue
+            results[path] = encodings
+            entries[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": miss_hashes[path]}
+
+        hits = len(results) - len(misses) + failed
+        removed = len(set(old_entries) - set(entries))
+        logger.info(f"Face encoding cache: {hits} hits, {len(misses)} misses ({failed} unreadable), {removed} removed.")
+        self.last_stats = {"hits": hits, "misses": len(misses), "removed": removed}
+
+        # Release the memory map before the file underneath it is replaced.
+        del old_encodings
+        if dirty or misses or removed:
+            rows, next_row = [], 0
+            for path in entries:
+                encodings = results[path]
+                entries[path].update({"row": next_row, "count": len(encodings)})
+                rows.append(encodings)
+                next_row += len(encodings)
+            self._save(entries, rows)
+
+        return results
@@ -3,86 +3,182 @@ import os
 import cv2
 import numpy as np
 
-# --- MODIFIED: Function to load faces and their statuses ---
-def load_known_faces(base_dir):
+from .face_cache import FACE_CACHE_DIR, FaceEncodingCache
+
+# Threshold for recognition; lower is stricter. Default is ~0.6
+FACE_MATCH_TOLERANCE = 0.6
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# When one name appears under several statuses, the most restrictive one wins.
+STATUS_PRIORITY = {"banned": 3, "allowed": 2, "known": 1}
+
+class FaceGallery:
     """
-    Loads face encodings and their corresponding identities (name, status)
-    from subdirectories in the base directory.
+    An immutable index of reference face encodings.
+
+    All encodings live in one contiguous float32 matrix. Rows are grouped by
+    identity, and `labels` / `statuses` are row-parallel arrays, so mapping a
+    match back to a person is a plain array lookup. A person may have any
+    number of reference rows; matching reports the closest row per identity.
+    """
+    def __init__(self, names=(), statuses=(), encodings_per_identity=(), version=0):
+        # Bumped on every hot reload so consumers can tell a new gallery apart.
+        self.version = version
+        # Encoding cache hits/misses from the load that built this gallery.
+        self.cache_stats = {"hits": 0, "misses": 0, "removed": 0}
+        rows, row_labels, row_statuses, offsets = [], [], [], []
+        for name, status, encodings in zip(names, statuses, encodings_per_identity):
+            if len(encodings) == 0: continue
+            offsets.append(len(rows))
+            for encoding in encodings:
+                rows.append(encoding)
+                row_labels.append(name)
+                row_statuses.append(status)
+
+        self.encodings = np.ascontiguousarray(np.asarray(rows, dtype=np.float32).reshape(-1, 128))
+        self.labels = np.asarray(row_labels, dtype=object)
+        self.statuses = np.asarray(row_statuses, dtype=object)
+        # First row of every identity, used to reduce row distances to identity distances.
+        self._offsets = np.asarray(offsets, dtype=np.intp)
+        self._identity_names = self.labels[self._offsets] if len(offsets) else self.labels
+        self._identity_statuses = self.statuses[self._offsets] if len(offsets) else self.statuses
+        self._squared_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        self.identities = dict(zip(self._identity_names, self._identity_statuses))
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def distances(self, query_encodings):
+        """Returns an (M, identities) matrix with the closest reference distance per identity."""
+        queries = np.asarray(query_encodings, dtype=np.float32).reshape(-1, 128)
+        if len(self._offsets) == 0:
+            return np.empty((len(queries), 0), dtype=np.float32)
+        squared = (np.einsum('ij,ij->i', queries, queries)[:, None] + self._squared_norms[None, :]
+                   - 2.0 * queries @ self.encodings.T)
+        row_distances = np.sqrt(np.maximum(squared, 0.0))
+        return np.minimum.reduceat(row_distances, self._offsets, axis=1)
+
+    def match(self, query_encodings, k=1, tolerance=FACE_MATCH_TOLERANCE):
+        """
+        Finds the k nearest identities for every query encoding in one call.
+
+        Returns:
+            list: One list per query of up to k (name, status, distance) tuples,
+                  nearest first, limited to matches below the tolerance.
+        """
+        distances = self.distances(query_encodings)
+        if distances.shape[1] == 0:
+            return [[] for _ in range(len(distances))]
+
+        k = min(k, distances.shape[1])
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+
+        results = []
+        for indices, dists in zip(nearest, nearest_distances):
+            results.append([(self._identity_names[i], self._identity_statuses[i], float(d))
+                            for i, d in zip(indices, dists) if d < tolerance])
+        return results
+
+def iter_person_images(base_dir):
+    """
+    Yields (person_name, status, image_path) for every reference image.
 
     Directory structure should be:
     - base_dir/allowed/person_a.jpg
     - base_dir/banned/person_b.jpg
+    - base_dir/banned/person_b/any_name.jpg  (several images of one person)
     - base_dir/person_c.jpg  (for neutral/known status)
     """
-    known_face_encodings = []
-    # This dictionary will store {name: status}
-    known_face_identities = {}
-
-    print("Loading known faces...")
-    for status in os.listdir(base_dir):
-        status_path = os.path.join(base_dir, status)
-        
+    for entry in sorted(os.listdir(base_dir)):
+        entry_path = os.path.join(base_dir, entry)
+
         # Handle images directly in the root folder (neutral status)
-        if os.path.isfile(status_path):
-            person_name = os.path.splitext(status)[0]
-            if person_name in known_face_identities: continue # Avoid duplicates
-            
-            image = face_recognition.load_image_file(status_path)
-            encodings = face_recognition.face_encodings(image)
-            if encodings:
-                known_face_encodings.append(encodings[0])
-                known_face_identities[person_name] = "known" # Neutral status
-                print(f"  - Loaded '{person_name}' (Status: Known)")
+        if os.path.isfile(entry_path):
+            if entry.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.splitext(entry)[0], "known", entry_path
             continue
 
         # Handle 'allowed' and 'banned' subdirectories
-        if os.path.isdir(status_path):
-            for filename in os.listdir(status_path):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    person_name = os.path.splitext(filename)[0]
-                    if person_name in known_face_identities: continue
-
-                    image_path = os.path.join(status_path, filename)
-                    image = face_recognition.load_image_file(image_path)
-                    encodings = face_recognition.face_encodings(image)
-                    if encodings:
-                        known_face_encodings.append(encodings[0])
-                        known_face_identities[person_name] = status # 'allowed' or 'banned'
-                        print(f"  - Loaded '{person_name}' (Status: {status.capitalize()})")
-
-    return known_face_encodings, known_face_identities
-
-# --- MODIFIED: Function to return name, status, and distance ---
-def recognize_face(known_face_encodings, known_face_identities, frame_crop):
+        status = entry
+        for filename in sorted(os.listdir(entry_path)):
+            path = os.path.join(entry_path, filename)
+            if os.path.isdir(path):
+                for image_name in sorted(os.listdir(path)):
+                    if image_name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield filename, status, os.path.join(path, image_name)
+            elif filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.splitext(filename)[0], status, path
+
+def build_gallery(records):
+    """Groups (person_name, status, encoding) records into a FaceGallery."""
+    statuses, encodings = {}, {}
+    for name, status, encoding in records:
+        previous = statuses.get(name)
+        if previous is not None and previous != status:
+            print(f"  - Warning: '{name}' is registered as both {previous} and {status}.")
+            if STATUS_PRIORITY.get(status, 0) < STATUS_PRIORITY.get(previous, 0):
+                status = previous
+        statuses[name] = status
+        encodings.setdefault(name, []).append(encoding)
+
+    names = list(statuses)
+    return FaceGallery(names, [statuses[n] for n in names], [encodings[n] for n in names])
+
+def load_known_faces(base_dir, cache_dir=FACE_CACHE_DIR, verbose=True):
     """
-    Finds the best match for a face in a cropped frame and returns their
-    name, status, and the face distance.
+    Loads face encodings and their corresponding identities (name, status)
+    from subdirectories in the base directory and returns a FaceGallery.
+    Every image of a person is kept as an additional reference encoding.
+
+    Encodings are served from the on-disk cache in `cache_dir`; only new or
+    changed images are encoded, in parallel across a process pool.
     """
+    if verbose: print("Loading known faces...")
+    images = list(iter_person_images(base_dir))
+    cache = FaceEncodingCache(cache_dir)
+    encodings_by_path = cache.encode([path for _, _, path in images])
+
+    records = []
+    for person_name, status, image_path in images:
+        # Images that could not be read are missing from the result.
+        encodings = encodings_by_path.get(image_path)
+        if encodings is not None and len(encodings):
+            records.append((person_name, status, encodings[0]))
+            if verbose: print(f"  - Loaded '{person_name}' (Status: {status.capitalize()}) from {image_path}")
+
+    gallery = build_gallery(records)
+    gallery.cache_stats = cache.last_stats
+    return gallery
+
+def encode_face(frame_crop):
+    """Returns the encoding of the first face found in a BGR crop, or None."""
     if frame_crop.size == 0:
-        return "Unknown", "unknown", 0.0
+        return None
 
     # Convert BGR (OpenCV) to RGB (face_recognition)
     rgb_frame_crop = cv2.cvtColor(frame_crop, cv2.COLOR_BGR2RGB)
-    
+
     face_locations = face_recognition.face_locations(rgb_frame_crop)
     if not face_locations:
-        return "Unknown", "unknown", 0.0
+        return None
 
-    face_encodings = face_recognition.face_encodings(rgb_frame_crop, face_locations)
-    if not face_encodings:
+    face_encodings = face_recognition.face_encodings(rgb_frame_crop, face_locations[:1])
+    return face_encodings[0] if face_encodings else None
+
+def recognize_face(gallery, frame_crop):
+    """
+    Finds the best match for a face in a cropped frame and returns their
+    name, status, and the face distance.
+    """
+    encoding = encode_face(frame_crop)
+    if encoding is None:
         return "Unknown", "unknown", 0.0
 
-    face_distances = face_recognition.face_distance(known_face_encodings, face_encodings[0])
-    
-    if len(face_distances) > 0:
-        best_match_index = np.argmin(face_distances)
-        # Threshold for recognition; lower is stricter. Default is ~0.6
-        if face_distances[best_match_index] < 0.6:
-            # Get the name from the dictionary keys based on the index
-            name = list(known_face_identities.keys())[best_match_index]
-            # Get the status using the name
-            status = known_face_identities[name]
-            distance = face_distances[best_match_index]
-            return name, status, distance
-
-    return "Unknown", "unknown", 0.0
\ No newline at end of file
+    matches = gallery.match(encoding, k=1)[0]
+    if matches:
+        return matches[0]
+
+    return "Unknown", "unknown", 0.0
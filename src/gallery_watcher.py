@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+
+from .face_cache import FACE_CACHE_DIR
+from .face_recognition_util import iter_person_images, load_known_faces
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+GALLERY_POLL_SECONDS = 5.0
+
+class GalleryWatcher:
+    """
+    Keeps the face gallery in sync with the registered faces directory
+    while the surveillance process is running.
+
+    Each reload builds a brand-new FaceGallery (only changed images are
+    re-encoded thanks to the encoding cache) and publishes it with a single
+    attribute assignment. Readers grab `watcher.gallery` once per frame and
+    never take a lock.
+    """
+    def __init__(self, base_dir, cache_dir=FACE_CACHE_DIR, poll_interval=GALLERY_POLL_SECONDS):
+        self.base_dir = base_dir
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self._reload_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._fingerprint = self._scan()
+        self.gallery = load_known_faces(base_dir, cache_dir)
+
+    def _scan(self):
+        """Returns a cheap fingerprint of the directory: status, name, mtime and size per image."""
+        fingerprint = {}
+        for name, status, path in iter_person_images(self.base_dir):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint[path] = (name, status, stat.st_mtime_ns, stat.st_size)
+        return fingerprint
+
+    def reload(self):
+        """Rebuilds the gallery, swaps it in atomically and returns what changed."""
+        with self._reload_lock:
+            old_gallery = self.gallery
+            # Scanned before loading so changes made during the load trigger another reload,
+            # but only stored once the new gallery is in place so a failed load is retried.
+            fingerprint = self._scan()
+            new_gallery = load_known_faces(self.base_dir, self.cache_dir, verbose=False)
+            new_gallery.version = old_gallery.version + 1
+
+            old, new = old_gallery.identities, new_gallery.identities
+            changes = {
+                "added": sorted(set(new) - set(old)),
+                "removed": sorted(set(old) - set(new)),
+                "restatused": sorted(name for name in set(old) & set(new) if old[name] != new[name]),
+                "version": new_gallery.version,
+                "encodings": len(new_gallery),
+            }
+            self.gallery = new_gallery
+            self._fingerprint = fingerprint
+
+        logger.info(f"Face gallery reloaded (version {changes['version']}): {len(changes['added'])} added, "
+                    f"{len(changes['removed'])} removed, {len(changes['restatused'])} re-statused.")
+        return changes
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                if self._scan() != self._fingerprint:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"Could not reload face gallery: {e}")
+
+    def start(self):
+        """Starts polling the directory for changes in a daemon thread."""
+        t = threading.Thread(target=self._watch, name="gallery-watcher", daemon=True)
+        t.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
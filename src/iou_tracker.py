@@ -0,0 +1,169 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# --- CONFIGURATION ---
+IOU_MATCH_THRESHOLD = 0.3
+# Detections below this confidence only extend existing tracks (ByteTrack-style second pass).
+HIGH_CONFIDENCE_THRESHOLD = 0.6
+
+# Constant-velocity Kalman model over (cx, cy, area, aspect, vx, vy, v_area), as in SORT.
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 1e-4])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_INITIAL_COVARIANCE = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+def ltwh_to_measurements(boxes):
+    """Converts (M, 4) [left, top, width, height] boxes to (M, 4) [cx, cy, area, aspect] measurements."""
+    w, h = boxes[:, 2], boxes[:, 3]
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-6)], axis=1)
+
+def states_to_ltrb(means):
+    """Converts (N, 7) Kalman states to (N, 4) [x1, y1, x2, y2] boxes."""
+    area = np.maximum(means[:, 2], 0.0)
+    w = np.sqrt(area * np.maximum(means[:, 3], 0.0))
+    h = np.divide(area, w, out=np.zeros_like(w), where=w > 0)
+    cx, cy = means[:, 0], means[:, 1]
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between (N, 4) and (M, 4) ltrb boxes, computed in one broadcast."""
+    a, b = boxes_a[:, None, :], boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+class IoUTrack:
+    """
+    One track of the IoU tracker. Exposes the same attributes the pipeline
+    reads from DeepSort tracks: `track_id`, `to_ltrb()`, `is_confirmed()`
+    and `time_since_update`.
+    """
+    def __init__(self, track_id, measurement, confidence, n_init):
+        self.track_id = track_id
+        self.mean = np.zeros(7)
+        self.mean[:4] = measurement
+        self.covariance = _INITIAL_COVARIANCE.copy()
+        self.det_conf = confidence
+        self.hits = 1
+        self.age = 1
+        self.time_since_update = 0
+        self._n_init = n_init
+
+    def is_confirmed(self):
+        return self.hits >= self._n_init
+
+    def is_tentative(self):
+        return not self.is_confirmed()
+
+    def to_ltrb(self):
+        return states_to_ltrb(self.mean[None])[0]
+
+    def to_tlwh(self):
+        x1, y1, x2, y2 = self.to_ltrb()
+        return np.array([x1, y1, x2 - x1, y2 - y1])
+
+class IoUTracker:
+    """
+    A SORT/ByteTrack-style tracker that uses only box geometry.
+
+    Every track carries a constant-velocity Kalman filter; prediction and
+    correction run on the stacked states of all tracks at once. Detections
+    are assigned to predicted boxes with the Hungarian algorithm on a
+    vectorized IoU matrix, first the confident detections and then the
+    remaining low-confidence ones against the tracks still unmatched. No
+    appearance embedding is computed, so the frame is not needed.
+
+    `update_tracks()` takes the same detection format as DeepSort, so the
+    two trackers are interchangeable.
+    """
+    def __init__(self, max_age=30, n_init=3, iou_threshold=IOU_MATCH_THRESHOLD,
+                 high_confidence=HIGH_CONFIDENCE_THRESHOLD):
+        self.max_age = max_age
+        self.n_init = n_init
+        self.iou_threshold = iou_threshold
+        self.high_confidence = high_confidence
+        self.tracks = []
+        self._next_id = 1
+
+    def _predict(self):
+        means = np.stack([t.mean for t in self.tracks])
+        covariances = np.stack([t.covariance for t in self.tracks])
+        # Stop a shrinking box from predicting a negative area.
+        means[means[:, 2] + means[:, 6] <= 0, 6] = 0.0
+        means = means @ _F.T
+        covariances = _F @ covariances @ _F.T + _Q
+        for track, mean, covariance in zip(self.tracks, means, covariances):
+            track.mean, track.covariance = mean, covariance
+            track.age += 1
+            track.time_since_update += 1
+
+    def _correct(self, pairs, measurements, confidences):
+        tracks = [self.tracks[t] for t, _ in pairs]
+        det_indices = [d for _, d in pairs]
+        means = np.stack([t.mean for t in tracks])
+        covariances = np.stack([t.covariance for t in tracks])
+        z = measurements[det_indices]
+
+        innovation_cov = covariances[:, :4, :4] + _R
+        # K = P H^T S^-1, solved for all matched tracks in one call (S is symmetric).
+        gain = np.linalg.solve(innovation_cov, covariances[:, :4, :]).transpose(0, 2, 1)
+        means = means + (gain @ (z - means[:, :4])[..., None])[..., 0]
+        covariances = covariances - gain @ covariances[:, :4, :]
+        for track, mean, covariance, det_index in zip(tracks, means, covariances, det_indices):
+            track.mean, track.covariance = mean, covariance
+            track.det_conf = confidences[det_index]
+            track.hits += 1
+            track.time_since_update = 0
+
+    def _associate(self, track_indices, det_indices, track_boxes, det_boxes):
+        """Returns (matched (track, det) pairs, unmatched track indices, unmatched det indices)."""
+        if not track_indices or len(det_indices) == 0:
+            return [], track_indices, list(det_indices)
+        iou = iou_matrix(track_boxes[track_indices], det_boxes[det_indices])
+        rows, cols = linear_sum_assignment(-iou)
+        keep = iou[rows, cols] >= self.iou_threshold
+        rows, cols = rows[keep], cols[keep]
+        pairs = [(track_indices[r], det_indices[c]) for r, c in zip(rows, cols)]
+        matched_rows, matched_cols = set(rows.tolist()), set(cols.tolist())
+        unmatched_tracks = [t for i, t in enumerate(track_indices) if i not in matched_rows]
+        unmatched_dets = [d for i, d in enumerate(det_indices) if i not in matched_cols]
+        return pairs, unmatched_tracks, unmatched_dets
+
+    def update_tracks(self, raw_detections, frame=None):
+        """
+        Advances every track by one frame and matches it to the new detections.
+
+        Args:
+            raw_detections (list): [([left, top, w, h], confidence, class_id), ...]
+            frame: Ignored; accepted for compatibility with DeepSort.
+
+        Returns:
+            list: All live tracks, including tentative and missed ones.
+        """
+        if self.tracks: self._predict()
+
+        det_boxes_ltwh = np.array([d[0] for d in raw_detections], dtype=float).reshape(-1, 4)
+        confidences = [float(d[1]) for d in raw_detections]
+        det_boxes = np.concatenate([det_boxes_ltwh[:, :2], det_boxes_ltwh[:, :2] + det_boxes_ltwh[:, 2:]], axis=1)
+        measurements = ltwh_to_measurements(det_boxes_ltwh)
+        track_boxes = states_to_ltrb(np.stack([t.mean for t in self.tracks])) if self.tracks else np.empty((0, 4))
+
+        is_high = np.array(confidences) >= self.high_confidence
+        high, low = np.flatnonzero(is_high), np.flatnonzero(~is_high)
+        pairs, unmatched_tracks, unmatched_high = self._associate(list(range(len(self.tracks))), high, track_boxes, det_boxes)
+        low_pairs, _, _ = self._associate(unmatched_tracks, low, track_boxes, det_boxes)
+        pairs += low_pairs
+        if pairs: self._correct(pairs, measurements, confidences)
+
+        # Tentative tracks die on their first miss; confirmed ones survive up to max_age frames.
+        self.tracks = [t for t in self.tracks
+                       if t.time_since_update == 0 or (t.is_confirmed() and t.time_since_update <= self.max_age)]
+        for det_index in unmatched_high:
+            self.tracks.append(IoUTrack(str(self._next_id), measurements[det_index], confidences[det_index], self.n_init))
+            self._next_id += 1
+        return self.tracks
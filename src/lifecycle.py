@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Component states, in the order a component moves through them.
+PENDING, STARTING, READY, FAILED, STOPPED = "pending", "starting", "ready", "failed", "stopped"
+
+class Component:
+    """One named resource: how to create it, what it needs first and how to stop it."""
+    def __init__(self, name, init, depends_on=(), stop=None, check=None, detail=None):
+        self.name = name
+        self.init = init
+        self.depends_on = tuple(depends_on)
+        self.stop = stop
+        # Optional liveness probe (value -> bool) and extra status (value -> dict) for /healthz.
+        self.check = check
+        self.detail = detail
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.init_seconds = None
+        self.done = threading.Event()
+
+    def status(self):
+        status = {"state": self.state, "init_seconds": self.init_seconds}
+        if self.error: status["error"] = self.error
+        if self.state == READY:
+            if self.check:
+                try: status["alive"] = bool(self.check(self.value))
+                except Exception as e: status.update(alive=False, error=str(e))
+            if self.detail:
+                try: status.update(self.detail(self.value))
+                except Exception: pass
+        elif self.state == STARTING and self.started_at is not None:
+            status["elapsed_seconds"] = time.monotonic() - self.started_at
+        return status
+
+class LifecycleManager:
+    """
+    Starts the app's components concurrently and tracks their state.
+
+    Each component is initialized on its own thread as soon as the
+    components it depends on are ready, and receives their values as
+    arguments. `start()` returns immediately, so the web server can bind
+    its port while the model, gallery and cameras are still loading. A
+    component whose dependency failed fails too. `stop()` shuts ready
+    components down in reverse start order.
+    """
+    def __init__(self):
+        self._components = {}
+        self._ready_order = []
+        self._lock = threading.Lock()
+        self.started_at = None
+
+    def add(self, name, init, depends_on=(), stop=None, check=None, detail=None):
+        unknown = [d for d in depends_on if d not in self._components]
+        if unknown:
+            raise ValueError(f"Component '{name}' depends on unknown components {unknown}")
+        self._components[name] = Component(name, init, depends_on, stop, check, detail)
+        return self
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for component in self._components.values():
+            threading.Thread(target=self._init_component, args=(component,), name=f"init-{component.name}", daemon=True).start()
+        return self
+
+    def _init_component(self, component):
+        dependencies = [self._components[name] for name in component.depends_on]
+        for dependency in dependencies:
+            dependency.done.wait()
+        failed = [d.name for d in dependencies if d.state != READY]
+        if failed:
+            component.state, component.error = FAILED, f"dependencies not ready: {failed}"
+            component.done.set()
+            return
+
+        # started_at first: status() reads it as soon as the state says STARTING.
+        component.started_at = time.monotonic()
+        component.state = STARTING
+        try:
+            value = component.init(*(d.value for d in dependencies))
+        except Exception as e:
+            component.init_seconds = time.monotonic() - component.started_at
+            component.state, component.error = FAILED, f"{type(e).__name__}: {e}"
+            logger.exception(f"Component '{component.name}' failed to initialize.")
+        else:
+            component.init_seconds = time.monotonic() - component.started_at
+            component.value, component.state = value, READY
+            with self._lock:
+                self._ready_order.append(component)
+            logger.info(f"Component '{component.name}' ready in {component.init_seconds:.2f}s.")
+        finally:
+            component.done.set()
+
+    def get(self, name):
+        """Returns the component's value, or None until it is ready."""
+        component = self._components[name]
+        return component.value if component.state == READY else None
+
+    def wait(self, name=None, timeout=None):
+        """Waits for one component (or all of them) to finish initializing. Returns True if they are ready."""
+        components = [self._components[name]] if name else list(self._components.values())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for component in components:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not component.done.wait(remaining): return False
+        return all(c.state == READY for c in components)
+
+    @property
+    def ready(self):
+        return all(c.state == READY for c in self._components.values())
+
+    def status(self):
+        """Per-component state and init time, plus overall readiness and liveness."""
+        components = {name: c.status() for name, c in self._components.items()}
+        return {
+            "ready": all(s["state"] == READY for s in components.values()),
+            "healthy": all(s["state"] != FAILED and s.get("alive", True) for s in components.values()),
+            "uptime_seconds": time.monotonic() - self.started_at if self.started_at else 0.0,
+            "components": components,
+        }
+
+    def stop(self):
+        with self._lock:
+            components, self._ready_order = list(reversed(self._ready_order)), []
+        for component in components:
+            if component.stop:
+                try: component.stop(component.value)
+                except Exception as e: logger.error(f"Error stopping component '{component.name}': {e}")
+            component.state = STOPPED
@@ -0,0 +1,201 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# --- CONFIGURATION ---
+# Time one in every N stage executions. 1 times everything; the cost is a
+# couple of microseconds per stage, far below 1% of a frame.
+METRICS_SAMPLE_EVERY = int(os.environ.get("METRICS_SAMPLE_EVERY", "1"))
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RATE_WINDOW_SECONDS = 5.0
+
+_NULL_TIMING = nullcontext()
+
+def _label_text(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    """A monotonically increasing value, with a recent per-second rate for JSON stats."""
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_value = 0
+        self._rate = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def rate(self):
+        """Average increments per second over the last few seconds."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed >= RATE_WINDOW_SECONDS:
+                self._rate = (self.value - self._window_value) / elapsed
+                self._window_start, self._window_value = now, self.value
+            elif self._rate == 0.0 and elapsed > 0:
+                return (self.value - self._window_value) / elapsed
+            return self._rate
+
+class Histogram:
+    """Fixed-bucket latency histogram; observing is one bisect and three additions."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Estimates a quantile from the buckets (upper bound of the bucket that contains it)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0: return 0.0
+        target, running = q * total, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= target:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+class _Timing:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class MetricsStageTimer:
+    """Stage timer for the live pipeline that records sampled durations into histograms."""
+    def __init__(self, registry, name, **labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self._histograms = {}
+        self._calls = 0
+
+    def stage(self, stage):
+        self._calls += 1
+        if self._calls % self.registry.sample_every:
+            return _NULL_TIMING
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = self.registry.histogram(self.name, stage=stage, **self.labels)
+        return _Timing(histogram)
+
+class MetricsRegistry:
+    """
+    Holds counters, histograms and gauges and renders them as Prometheus
+    text or a JSON-friendly dict.
+
+    Gauges are callables evaluated only when metrics are read, so values
+    such as queue depths or active tracks cost nothing on the hot path.
+    """
+    def __init__(self, sample_every=METRICS_SAMPLE_EVERY):
+        self.sample_every = max(1, sample_every)
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _get(self, store, factory, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = store.get(key)
+        if metric is None:
+            with self._lock:
+                metric = store.setdefault(key, factory())
+        return metric
+
+    def counter(self, name, **labels):
+        return self._get(self._counters, Counter, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get(self._histograms, Histogram, name, labels)
+
+    def gauge(self, name, func, **labels):
+        """Registers a callable whose return value is reported as a gauge."""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = func
+
+    def timer(self, name, **labels):
+        return MetricsStageTimer(self, name, **labels)
+
+    def time(self, name, **labels):
+        """Context manager timing one block into a histogram."""
+        return _Timing(self.histogram(name, **labels))
+
+    def _items(self, store):
+        with self._lock:
+            return sorted(store.items())
+
+    def _gauge_values(self):
+        values = []
+        for (name, labels), func in self._items(self._gauges):
+            try:
+                values.append((name, labels, float(func())))
+            except Exception:
+                continue
+        return values
+
+    def render_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines, typed = [], set()
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), counter in self._items(self._counters):
+            declare(name, "counter")
+            lines.append(f"{name}{_label_text(labels)} {counter.value}")
+        for name, labels, value in self._gauge_values():
+            declare(name, "gauge")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), histogram in self._items(self._histograms):
+            declare(name, "histogram")
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Returns counters (with rates), gauges and histogram summaries as plain dicts."""
+        def key(name, labels):
+            return name + _label_text(labels)
+        return {
+            "counters": {key(n, l): {"total": c.value, "per_second": c.rate()} for (n, l), c in self._items(self._counters)},
+            "gauges": {key(n, l): v for n, l, v in self._gauge_values()},
+            "histograms": {
+                key(n, l): {"count": h.count, "mean": h.sum / h.count if h.count else 0.0,
+                            "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                for (n, l), h in self._items(self._histograms)
+            },
+        }
+
+# Process-wide registry used by the app.
+REGISTRY = MetricsRegistry()
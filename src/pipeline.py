@@ -0,0 +1,362 @@
+import cv2
+import os
+import time
+import logging
+from datetime import datetime
+
+from .alerting import trigger_alert, trigger_banned_person_alert
+from .broadcast import FrameBroadcaster
+from .event_store import (EVENT_ALERT, EVENT_IDENTITY, EVENT_TRACK_START, EVENT_ZONE_ENTER, EVENT_ZONE_EXIT,
+                          get_event_store)
+from .scheduler import InferenceScheduler
+from .stage_timer import NULL_TIMER
+from .reid_cache import ReIdCache, ReIdEntry, appearance_embedding
+from .recognition_pool import PRIORITY_NEW_TRACK, PRIORITY_IN_ZONE, PRIORITY_STALE_UNKNOWN
+from .tracking import update_tracker_with_detections
+from .zones import DEFAULT_DWELL_SECONDS, Zone, ZoneEngine
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+FRAME_PROCESSING_INTERVAL = 3
+RE_RECOGNITION_INTERVAL_FRAMES = 15
+# Default dwell limit for unknown people; per-zone limits come from zones.json.
+TIME_THRESHOLD_SECONDS = DEFAULT_DWELL_SECONDS
+TRACK_TTL_SECONDS = 2.0
+# Used when a camera has no zones configured.
+ZONE_START_X, ZONE_START_Y, ZONE_WIDTH, ZONE_HEIGHT = 0, 0, 350, 720
+FORBIDDEN_ZONE = (ZONE_START_X, ZONE_START_Y, ZONE_START_X + ZONE_WIDTH, ZONE_START_Y + ZONE_HEIGHT)
+ZONE_NAME = "restricted"
+UNKNOWN_SIGHTINGS_DIR = "unknown_person_sightings"
+
+class CameraPipeline:
+    """
+    Per-camera analysis state: the tracker, the people currently tracked,
+    the zones and their alert cooldowns, plus the broadcaster its annotated
+    frames are published to.
+
+    Detection is done by the caller (batched across cameras); this class
+    takes the detections for one frame through tracking, recognition
+    hand-off, zone rules and alerting, and draws the overlay. Each person
+    records when they entered each zone (by their foot-point); every zone
+    alerts on the statuses and dwell times in its rules. If a
+    ClipRecorder is given, every published frame is fed to it and each
+    alert saves a clip around the event.
+
+    People whose tracks end are remembered in a re-identification cache
+    (shared between cameras); a new track that matches a remembered person
+    keeps their identity, zone dwell times and sighting image. A name and
+    status carried over by appearance alone are provisional: zone rules
+    treat the person as unknown until a face check confirms or corrects them.
+    """
+    def __init__(self, camera_id, stream, tracker, recognition_pool, gallery_watcher,
+                 forbidden_zone=FORBIDDEN_ZONE, processing_interval=FRAME_PROCESSING_INTERVAL,
+                 adaptive=True, timer=NULL_TIMER, recorder=None, reid_cache=None, zones=None,
+                 sightings_dir=UNKNOWN_SIGHTINGS_DIR):
+        self.camera_id = camera_id
+        self.stream = stream
+        self.tracker = tracker
+        self.recognition_pool = recognition_pool
+        self.gallery_watcher = gallery_watcher
+        if not zones: zones = [Zone.from_rect(ZONE_NAME, [int(v) for v in forbidden_zone])]
+        self.zone_engine = ZoneEngine(zones)
+        self.scheduler = InferenceScheduler(base_interval=processing_interval, adaptive=adaptive)
+        # Records per-stage durations; the default does nothing.
+        self.timer = timer
+        self.broadcaster = FrameBroadcaster()
+        self.recorder = recorder
+        self.reid_cache = reid_cache if reid_cache is not None else ReIdCache()
+
+        self.frame_count = 0
+        self._last_recheck_frame = 0
+        # Loitering alert cooldowns are kept per zone.
+        self.last_alert_times = {}
+        self.tracked_persons = {}
+        self.gallery_version = gallery_watcher.gallery.version
+        self.sightings_dir = sightings_dir
+        if not os.path.exists(sightings_dir): os.makedirs(sightings_dir)
+
+    def due_for_inference(self, frame, now):
+        """Advances the frame counter and asks the scheduler whether this frame should go through detection."""
+        self.frame_count += 1
+        tracks_in_zone = any(p["zones"] for p in self.tracked_persons.values())
+        return self.scheduler.should_run(frame, now, bool(self.tracked_persons), tracks_in_zone)
+
+    def _record_event(self, event_type, track_id, person_state, current_time, zone=None, **details):
+        store = get_event_store()
+        # Zone entries are often recorded while recognition is still pending, so an identity is
+        # written once for every zone the person is in; "unknown people in zone X" is then a zone filter.
+        zones = sorted(person_state["zones"]) if event_type == EVENT_IDENTITY and zone is None else None
+        for zone in zones or (zone,):
+            store.record(event_type, self.camera_id, track_id, person_state["name"], person_state["status"],
+                         zone, ts=current_time, person_id=person_state["person_id"], **details)
+
+    def _recognition_key(self, track_id):
+        # Track IDs are only unique per tracker, so requests are keyed by camera as well.
+        return (self.camera_id, track_id)
+
+    def _crop(self, frame, ltrb):
+        x1, y1, x2, y2 = map(int, ltrb)
+        return frame[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)]
+
+    def _sync_gallery(self, face_gallery, current_time):
+        """Re-statuses tracked people after a hot reload. Returns True if the gallery changed."""
+        if face_gallery.version == self.gallery_version: return False
+        self.gallery_version = face_gallery.version
+        for track_id, person in self.tracked_persons.items():
+            if person["status"] in ("unknown", "pending"): continue
+            new_status = face_gallery.identities.get(person["name"], "unknown")
+            if new_status != person["status"]:
+                logger.info(f"[{self.camera_id}] Person ID {track_id} ('{person['name']}') changed status to {new_status.capitalize()} after gallery reload.")
+                if new_status == "unknown": person["name"] = "Unknown"
+                person["status"] = new_status
+                self._reset_zone_timers(person, current_time)
+                self._record_event(EVENT_IDENTITY, track_id, person, current_time, reason="gallery_reload")
+        return True
+
+    def _reset_zone_timers(self, person_state, current_time):
+        """Restarts dwell timers and re-arms alerts after a person's status changes."""
+        person_state["zones"] = {name: current_time for name in person_state["zones"]}
+        person_state["alerted_zones"] = set()
+
+    def _carry_over(self, person_state, entry, current_time):
+        """Gives a re-identified person the id, sighting, alerted zones and zone dwell times of their previous track."""
+        person_state.update({"person_id": entry.person_id, "sighting": person_state["sighting"] or entry.sighting})
+        person_state["alerted_zones"] |= entry.alerted_zones
+        if person_state["face_encoding"] is None: person_state["face_encoding"] = entry.face_encoding
+        for name, dwell in entry.zone_dwell.items():
+            entered_at = current_time - dwell
+            if name in person_state["zones"]:
+                person_state["zones"][name] = min(person_state["zones"][name], entered_at)
+            else:
+                # Applied only if the person is in that zone on their next zone update.
+                person_state["zone_carry"][name] = dwell
+
+    def _remember(self, person_state):
+        """Hands a person whose track ended to the re-identification cache."""
+        if person_state["status"] == "pending": return
+        last_seen = person_state["last_seen_time"]
+        self.reid_cache.remember(ReIdEntry(
+            person_state["person_id"], self.camera_id, person_state["name"], person_state["status"],
+            person_state["face_encoding"], person_state["appearance"],
+            {name: last_seen - entered_at for name, entered_at in person_state["zones"].items()},
+            frozenset(person_state["alerted_zones"]), person_state["sighting"], last_seen))
+
+    def apply_recognition_results(self, results, face_gallery, current_time=None):
+        """Matches finished (track_id, encoding) pairs against the gallery in one batch and updates the tracks."""
+        current_time = time.time() if current_time is None else current_time
+        results = [(tid, enc) for tid, enc in results if tid in self.tracked_persons]
+        encoded = [(tid, enc) for tid, enc in results if enc is not None]
+        matches = dict(zip((tid for tid, _ in encoded), face_gallery.match([enc for _, enc in encoded]))) if encoded else {}
+
+        for track_id, encoding in results:
+            person_state = self.tracked_persons[track_id]
+            best = matches.get(track_id)
+            name, status, distance = best[0] if best else ("Unknown", "unknown", 0.0)
+
+            if person_state["status"] == "pending":
+                person_state.update({"name": name, "status": status, "distance": distance})
+                previous = self.reid_cache.match_face(encoding, current_time)
+                if previous is not None:
+                    logger.info(f"[{self.camera_id}] Person ID {track_id} is person {previous.person_id} seen {current_time - previous.last_seen:.0f}s ago.")
+                    self._carry_over(person_state, previous, current_time)
+                log_message = f"[{self.camera_id}] Person '{name}' (ID: {track_id}, Status: {status.capitalize()}) detected."
+                if status == 'unknown': logger.warning(log_message)
+                else: logger.info(log_message)
+
+                sighting_filename = None
+                # One sighting image per person: a re-identified person keeps the one already saved.
+                if status == 'unknown' and person_state["sighting"] is None:
+                    try:
+                        # Timestamped, since trackers reuse IDs after a restart.
+                        timestamp = datetime.fromtimestamp(current_time).strftime("%Y%m%d_%H%M%S")
+                        sighting_filename = os.path.join(self.sightings_dir, f"sighting_{self.camera_id}_id-{track_id}_{timestamp}.jpg")
+                        if not cv2.imwrite(sighting_filename, person_state["sighting_crop"]): sighting_filename = None
+                    except Exception: sighting_filename = None
+                    person_state["sighting"] = sighting_filename
+                person_state["sighting_crop"] = None
+                self._record_event(EVENT_IDENTITY, track_id, person_state, current_time,
+                                   distance=float(distance), sighting=person_state["sighting"],
+                                   reason="reid_face" if previous is not None else "recognized")
+            elif person_state["provisional"] and encoding is not None:
+                # A face settles an identity that was carried over by appearance alone.
+                person_state["provisional"] = False
+                if (name, status) != (person_state["name"], person_state["status"]):
+                    logger.info(f"[{self.camera_id}] Person ID {track_id} is '{name}' (Status: {status.capitalize()}), "
+                                f"not '{person_state['name']}' as matched by appearance.")
+                    person_state.update({"name": name, "status": status, "distance": distance})
+                    self._reset_zone_timers(person_state, current_time)
+                    self._record_event(EVENT_IDENTITY, track_id, person_state, current_time, distance=float(distance), reason="reid_corrected")
+            elif person_state["status"] == "unknown" and status != "unknown":
+                logger.info(f"[{self.camera_id}] Person ID {track_id} re-identified as '{name}' (Status: {status.capitalize()}).")
+                person_state.update({"name": name, "status": status, "distance": distance})
+                self._reset_zone_timers(person_state, current_time)
+                self._record_event(EVENT_IDENTITY, track_id, person_state, current_time, distance=float(distance), reason="re_identified")
+            if encoding is not None: person_state["face_encoding"] = encoding
+
+    def process_detections(self, frame, detections, recognition_results, current_time):
+        """Runs tracking, recognition hand-off, zone rules and alerting for one detected frame."""
+        timer = self.timer
+        processing_frame = frame.copy()
+        # Read the gallery once per frame; a hot reload swaps in a new object without locks.
+        face_gallery = self.gallery_watcher.gallery
+        gallery_changed = self._sync_gallery(face_gallery, current_time)
+
+        with timer.stage("track"):
+            tracks = update_tracker_with_detections(self.tracker, detections, processing_frame)
+        with timer.stage("recognize"):
+            self.apply_recognition_results(recognition_results, face_gallery, current_time)
+            active_tracks = self._update_tracked_persons(tracks, processing_frame, gallery_changed, current_time)
+        with timer.stage("zone"):
+            for track_id, zone_names in active_tracks.items():
+                self._apply_zone_rules(frame, track_id, zone_names, current_time)
+
+        inactive_ids = set(self.tracked_persons.keys()) - set(active_tracks)
+        stale_ids = {tid for tid, p in self.tracked_persons.items() if current_time - p["last_seen_time"] > TRACK_TTL_SECONDS}
+        removed_ids = inactive_ids.union(stale_ids)
+        self.recognition_pool.cancel([self._recognition_key(tid) for tid in removed_ids])
+        for inactive_id in removed_ids:
+            person_state = self.tracked_persons.pop(inactive_id, None)
+            if person_state is not None: self._remember(person_state)
+
+    def _update_tracked_persons(self, tracks, processing_frame, gallery_changed, current_time):
+        """Creates or refreshes person state for confirmed tracks and submits recognition requests. Returns {track_id: zone names}."""
+        pool = self.recognition_pool
+        # Processed frames are irregular with the adaptive scheduler, so count frames since the last re-check.
+        recheck_due = gallery_changed or self.frame_count - self._last_recheck_frame >= RE_RECOGNITION_INTERVAL_FRAMES
+        if recheck_due: self._last_recheck_frame = self.frame_count
+
+        confirmed = [(track.track_id, track.to_ltrb()) for track in tracks
+                     if track.is_confirmed() and track.time_since_update == 0]
+        # One vectorized hit-test for every track against every zone.
+        zone_hits = self.zone_engine.zones_for_boxes([ltrb for _, ltrb in confirmed], processing_frame.shape)
+
+        active_tracks = {}
+        for (track_id, ltrb), zone_names in zip(confirmed, zone_hits):
+            key = self._recognition_key(track_id)
+            active_tracks[track_id] = zone_names
+
+            is_new_person = track_id not in self.tracked_persons
+            if is_new_person:
+                person_crop = self._crop(processing_frame, ltrb).copy()
+                appearance = appearance_embedding(person_crop)
+                person_state = self.tracked_persons[track_id] = {
+                    "box": ltrb, "name": "Unknown", "status": "unknown", "distance": 0.0,
+                    "zones": {}, "alerted_zones": set(), "zone_carry": {}, "last_seen_time": current_time,
+                    "sighting_crop": person_crop, "person_id": None, "provisional": False,
+                    "appearance": appearance, "face_encoding": None, "sighting": None
+                }
+                # Someone who was just lost and looks the same keeps their identity without a face encoding.
+                previous = self.reid_cache.match_appearance(self.camera_id, appearance, current_time)
+                if previous is not None:
+                    person_state.update({"name": previous.name, "status": previous.status, "sighting_crop": None})
+                    self._carry_over(person_state, previous, current_time)
+                    logger.info(f"[{self.camera_id}] Person ID {track_id} matched person {previous.person_id} ('{previous.name}') by appearance.")
+                    # Similar clothing is not proof of identity: hold a known status until a face confirms it.
+                    if previous.status != "unknown":
+                        person_state["provisional"] = True
+                        if person_crop.size > 0:
+                            pool.submit(key, person_crop, PRIORITY_IN_ZONE if zone_names else PRIORITY_STALE_UNKNOWN)
+                else:
+                    person_state["person_id"] = self.reid_cache.new_person_id()
+                    if person_crop.size > 0 and pool.submit(key, person_crop, PRIORITY_NEW_TRACK):
+                        person_state.update({"name": "Pending", "status": "pending"})
+                self._record_event(EVENT_TRACK_START, track_id, person_state, current_time,
+                                   box=[int(v) for v in ltrb], reid=previous is not None)
+
+            person_state = self.tracked_persons[track_id]
+            person_state.update({"box": ltrb, "last_seen_time": current_time})
+
+            if person_state["status"] == "pending" and not is_new_person and not pool.is_pending(key):
+                # The request was evicted from a full queue; ask again.
+                pool.submit(key, self._crop(processing_frame, ltrb).copy(), PRIORITY_NEW_TRACK)
+
+            if (person_state["status"] == "unknown" or person_state["provisional"]) and recheck_due and not is_new_person:
+                person_crop = self._crop(processing_frame, ltrb)
+                if person_crop.size > 0:
+                    priority = PRIORITY_IN_ZONE if zone_names else PRIORITY_STALE_UNKNOWN
+                    pool.submit(key, person_crop.copy(), priority)
+        return active_tracks
+
+    def _apply_zone_rules(self, frame, track_id, zone_names, current_time):
+        """Records zone entries/exits and triggers the alerts each zone's rules call for."""
+        person_state = self.tracked_persons[track_id]
+        entries, carry = person_state["zones"], person_state["zone_carry"]
+        for name in zone_names - entries.keys():
+            # Dwell time carried over from a re-identified person's previous track counts towards this entry.
+            entries[name] = current_time - carry.get(name, 0.0)
+            self._record_event(EVENT_ZONE_ENTER, track_id, person_state, current_time, zone=name)
+        for name in entries.keys() - zone_names:
+            dwell = current_time - entries.pop(name)
+            self._record_event(EVENT_ZONE_EXIT, track_id, person_state, current_time, zone=name, dwell_seconds=round(dwell, 1))
+        carry.clear()
+
+        # Pending people accumulate dwell time so a slow recognition never delays the alert;
+        # the rules only fire once their status is known. A provisional status is not trusted yet.
+        status = "unknown" if person_state["provisional"] else person_state["status"]
+        for name, entered_at in entries.items():
+            limit = self.zone_engine.by_name[name].dwell_limit(status)
+            if limit is None or name in person_state["alerted_zones"]: continue
+            dwell = current_time - entered_at
+            if dwell < limit: continue
+            if status == "banned":
+                person_state["alerted_zones"].add(name)
+                trigger_banned_person_alert(frame, person_state["name"], self.camera_id, zone=name)
+                self._record_event(EVENT_ALERT, track_id, person_state, current_time, zone=name, alert="banned")
+                if self.recorder: self.recorder.trigger(f"banned_{person_state['name']}_{self.camera_id}_{name}", current_time)
+                continue
+            # -inf, not 0: the replay clock starts at 0, where a zero default would still be in cooldown.
+            previous_alert_time = self.last_alert_times.get(name, float("-inf"))
+            self.last_alert_times[name] = trigger_alert(frame, previous_alert_time, self.camera_id, now=current_time,
+                                                        zone=name, person_name=person_state["name"])
+            # While the zone's cooldown holds the alert back, the person stays unalerted and is checked again next frame.
+            if self.last_alert_times[name] != previous_alert_time:
+                person_state["alerted_zones"].add(name)
+                self._record_event(EVENT_ALERT, track_id, person_state, current_time, zone=name,
+                                   alert="loitering", loiter_seconds=round(dwell, 1))
+                if self.recorder: self.recorder.trigger(f"loitering_alert_{self.camera_id}_{name}", current_time)
+
+    def _longest_dwell(self, person, current_time):
+        """Longest time the person has spent in a zone whose dwell rule applies to them, or None."""
+        status = "unknown" if person["status"] == "pending" or person["provisional"] else person["status"]
+        dwells = [current_time - entered_at for name, entered_at in person["zones"].items()
+                  if (self.zone_engine.by_name[name].dwell_limit(status) or 0) > 0]
+        return max(dwells) if dwells else None
+
+    def annotate(self, frame, current_time):
+        """Draws tracked people and the zones onto the frame."""
+        for track_id, person in self.tracked_persons.items():
+            x1, y1, x2, y2 = map(int, person["box"])
+            status = person["status"]
+            # A trailing "?" marks a name carried over by appearance and not yet confirmed by a face.
+            label = f"{person['name']}{'?' if person['provisional'] else ''} (ID: {track_id})"
+
+            # Set box color based on your specified scheme
+            if status == "pending":
+                box_color = (0, 255, 255)  # Yellow while recognition is running
+            elif status == "banned":
+                box_color = (0, 165, 255)  # Orange for Banned
+            elif status == "allowed" or status == "known":
+                box_color = (255, 0, 0)    # Blue for Allowed and Known
+            else: # Unknown
+                box_color = (0, 255, 0)    # Green for Unknown
+
+            # If someone is loitering in a zone with a dwell limit for them, override color to Red
+            loiter_duration = self._longest_dwell(person, current_time)
+            if loiter_duration is not None:
+                box_color = (0, 0, 255)    # Red for Loitering
+                label += f" | T: {loiter_duration:.0f}s"
+
+            cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 2)
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
+
+        self.zone_engine.draw(frame)
+
+    def publish(self, frame, current_time=None):
+        """JPEG-encodes the annotated frame once and hands it to every viewer of this camera and to the clip recorder."""
+        with self.timer.stage("encode"):
+            ret, buffer = cv2.imencode('.jpg', frame)
+        if not ret: return
+        jpeg_bytes = buffer.tobytes()
+        self.broadcaster.publish(jpeg_bytes)
+        if self.recorder: self.recorder.add(jpeg_bytes, time.time() if current_time is None else current_time)
@@ -0,0 +1,143 @@
+import heapq
+import itertools
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .face_recognition_util import encode_face
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+RECOGNITION_WORKERS = 2
+MAX_PENDING_REQUESTS = 64
+
+# Lower values are served first.
+PRIORITY_NEW_TRACK = 0
+PRIORITY_IN_ZONE = 1
+PRIORITY_STALE_UNKNOWN = 2
+
+class RecognitionPool:
+    """
+    Encodes faces on a pool of worker processes so dlib never blocks the
+    frame loop.
+
+    Requests wait in a priority queue and are handed to the pool only when a
+    worker is free, so a burst of new tracks is always served before routine
+    re-checks. There is at most one request per track: re-submitting a
+    queued track replaces its crop and keeps the better priority, and tracks
+    already being encoded are skipped. Finished encodings are collected with
+    `drain_results()` and matched against the gallery by the caller.
+    """
+    def __init__(self, max_workers=RECOGNITION_WORKERS, max_pending=MAX_PENDING_REQUESTS):
+        self.max_pending = max_pending
+        # Spawned, not forked: forking a process that already runs capture and web threads
+        # can copy a lock some other thread is holding into the worker.
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self._free_workers = threading.Semaphore(max_workers)
+        self._condition = threading.Condition()
+        self._heap = []
+        self._queued = {}  # track_id -> heap entry
+        self._in_flight = set()
+        self._results = deque()
+        self._counter = itertools.count()
+        self._stopped = False
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._dispatch, name="recognition-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, track_id, crop, priority):
+        """
+        Queues a crop for encoding. Returns False if the track is already being
+        encoded, or if the queue is full of requests that are at least as urgent.
+        """
+        with self._condition:
+            if track_id in self._in_flight:
+                return False
+            previous = self._queued.get(track_id)
+            if previous is not None:
+                # Invalidate the old heap entry; it is skipped when popped.
+                previous[3] = None
+                priority = min(priority, previous[0])
+            elif len(self._queued) >= self.max_pending:
+                worst = max(self._queued.values(), key=lambda e: (e[0], e[1]))
+                # A full queue only makes room for a more urgent request.
+                if priority >= worst[0]:
+                    self.dropped += 1
+                    return False
+                self._evict(worst)
+            entry = [priority, next(self._counter), track_id, crop]
+            self._queued[track_id] = entry
+            heapq.heappush(self._heap, entry)
+            self._condition.notify()
+            return True
+
+    def _evict(self, worst):
+        worst[3] = None
+        del self._queued[worst[2]]
+        self.dropped += 1
+
+    def is_pending(self, track_id):
+        """True while the track is waiting for or undergoing encoding."""
+        with self._condition:
+            return track_id in self._queued or track_id in self._in_flight
+
+    def cancel(self, track_ids):
+        """Forgets queued requests for tracks that have disappeared."""
+        with self._condition:
+            for track_id in track_ids:
+                entry = self._queued.pop(track_id, None)
+                if entry is not None: entry[3] = None
+
+    def queue_depth(self):
+        with self._condition:
+            return len(self._queued)
+
+    def drain_results(self):
+        """Returns and clears the finished (track_id, encoding_or_None) pairs."""
+        results = []
+        while self._results:
+            results.append(self._results.popleft())
+        return results
+
+    def _dispatch(self):
+        while True:
+            self._free_workers.acquire()
+            with self._condition:
+                entry = None
+                while entry is None:
+                    while not self._heap and not self._stopped:
+                        self._condition.wait()
+                    if self._stopped: return
+                    entry = heapq.heappop(self._heap)
+                    if entry[3] is None: entry = None
+                _, _, track_id, crop = entry
+                del self._queued[track_id]
+                self._in_flight.add(track_id)
+            try:
+                future = self._executor.submit(encode_face, crop)
+            except RuntimeError:
+                return  # Executor is shutting down.
+            future.add_done_callback(lambda f, tid=track_id: self._on_done(tid, f))
+
+    def _on_done(self, track_id, future):
+        try:
+            encoding = future.result()
+        except Exception as e:
+            logger.error(f"Face encoding failed for track {track_id}: {e}")
+            encoding = None
+        # Publish the result before clearing the in-flight mark, so the track is never
+        # seen as neither pending nor answered and submitted a second time.
+        self._results.append((track_id, encoding))
+        with self._condition:
+            self._in_flight.discard(track_id)
+        self._free_workers.release()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._free_workers.release()
+        self._executor.shutdown(wait=False, cancel_futures=True)
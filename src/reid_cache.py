@@ -0,0 +1,140 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .metrics import REGISTRY
+
+# --- CONFIGURATION ---
+REID_TTL_SECONDS = 30.0
+REID_MAX_ENTRIES = 256
+# Stricter than the gallery tolerance: a wrong merge would hand one person's status to another.
+REID_FACE_TOLERANCE = 0.5
+# Cosine similarity between appearance descriptors; only compared within the same camera.
+REID_APPEARANCE_THRESHOLD = 0.9
+APPEARANCE_CROP_SIZE = (32, 64)
+APPEARANCE_BINS = (16, 8)
+# Brightness bins. Hue and saturation alone cannot tell white, grey and black clothing apart.
+APPEARANCE_VALUE_BINS = 8
+# Horizontal bands described separately, so a white shirt over dark trousers
+# does not match a dark shirt over white trousers.
+APPEARANCE_BANDS = 2
+
+def _unit(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def appearance_embedding(crop):
+    """
+    A cheap appearance descriptor for a person crop, from a downscaled copy:
+    for each horizontal band, a hue/saturation histogram and a (slightly
+    blurred, to tolerate lighting changes) brightness histogram. Each part
+    is unit-length and the whole is rescaled to unit length, so the cosine
+    similarity of two descriptors is the mean similarity of their parts.
+    Returns None for empty crops.
+    """
+    if crop is None or crop.size == 0: return None
+    small = cv2.resize(crop, APPEARANCE_CROP_SIZE, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    parts = []
+    for band in np.array_split(hsv, APPEARANCE_BANDS, axis=0):
+        parts.append(_unit(cv2.calcHist([band], [0, 1], None, list(APPEARANCE_BINS), [0, 180, 0, 256]).ravel()))
+        value = cv2.calcHist([band], [2], None, [APPEARANCE_VALUE_BINS], [0, 256]).ravel()
+        parts.append(_unit(np.convolve(value, [0.25, 0.5, 0.25], mode="same")))
+    if not all(part.any() for part in parts): return None
+    return (np.concatenate(parts) / np.sqrt(len(parts))).astype(np.float32)
+
+class ReIdEntry:
+    """What is remembered about a person after their track ends."""
+    __slots__ = ("person_id", "camera_id", "name", "status", "face_encoding", "appearance",
+                 "zone_dwell", "alerted_zones", "sighting", "last_seen")
+
+    def __init__(self, person_id, camera_id, name, status, face_encoding, appearance,
+                 zone_dwell, alerted_zones, sighting, last_seen):
+        self.person_id = person_id
+        self.camera_id = camera_id
+        self.name = name
+        self.status = status
+        self.face_encoding = face_encoding
+        self.appearance = appearance
+        # {zone name: seconds spent in it when the track ended}
+        self.zone_dwell = zone_dwell
+        self.alerted_zones = alerted_zones
+        self.sighting = sighting
+        self.last_seen = last_seen
+
+class ReIdCache:
+    """
+    Short-lived memory of people whose tracks recently ended, so a person
+    who is occluded or steps out of view keeps their identity when the
+    tracker gives them a new ID.
+
+    Entries are keyed by person id and expire after `ttl` seconds; beyond
+    `max_entries` the least recently seen entry is evicted. A new track is
+    matched by appearance (same camera only) before any face encoding is
+    requested, and a freshly encoded face is matched against remembered face
+    encodings (any camera). A match removes the entry, since the person is
+    being tracked again.
+    """
+    def __init__(self, ttl=REID_TTL_SECONDS, max_entries=REID_MAX_ENTRIES, face_tolerance=REID_FACE_TOLERANCE,
+                 appearance_threshold=REID_APPEARANCE_THRESHOLD, registry=REGISTRY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.face_tolerance = face_tolerance
+        self.appearance_threshold = appearance_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._person_ids = itertools.count(1)
+        self._hits = {"face": registry.counter("reid_hits_total", kind="face"),
+                      "appearance": registry.counter("reid_hits_total", kind="appearance")}
+        registry.gauge("reid_cache_entries", lambda: len(self._entries))
+
+    def new_person_id(self):
+        return next(self._person_ids)
+
+    def _expire(self, now):
+        # Entries are kept in last-seen order, so expired ones are at the front.
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.last_seen <= self.ttl: break
+            self._entries.popitem(last=False)
+
+    def remember(self, entry):
+        """Stores (or refreshes) a person whose track just ended."""
+        with self._lock:
+            self._entries.pop(entry.person_id, None)
+            self._entries[entry.person_id] = entry
+            self._expire(entry.last_seen)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def match_appearance(self, camera_id, appearance, now):
+        """Returns and removes the most similar remembered person from this camera, or None."""
+        if appearance is None: return None
+        with self._lock:
+            self._expire(now)
+            candidates = [e for e in self._entries.values() if e.camera_id == camera_id and e.appearance is not None]
+            if not candidates: return None
+            similarities = np.stack([e.appearance for e in candidates]) @ appearance
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.appearance_threshold: return None
+            self._hits["appearance"].inc()
+            return self._entries.pop(candidates[best].person_id)
+
+    def match_face(self, encoding, now):
+        """Returns and removes the remembered person with the closest face encoding, or None."""
+        if encoding is None: return None
+        with self._lock:
+            self._expire(now)
+            candidates = [e for e in self._entries.values() if e.face_encoding is not None]
+            if not candidates: return None
+            distances = np.linalg.norm(np.stack([e.face_encoding for e in candidates]) - encoding, axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > self.face_tolerance: return None
+            self._hits["face"].inc()
+            return self._entries.pop(candidates[best].person_id)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,120 @@
+import cv2
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+MOTION_FRAME_SIZE = (160, 90)
+MOTION_PIXEL_THRESHOLD = 25
+# Fraction of downscaled pixels that must change to count as motion.
+MOTION_AREA_FRACTION = 0.002
+MIN_INTERVAL_FRAMES = 1
+MAX_INTERVAL_FRAMES = 15
+# Target delay between capturing a frame and publishing its analysed result.
+LATENCY_BUDGET_SECONDS = 0.25
+# Even a still scene is re-checked this often so tracks do not expire (see TRACK_TTL_SECONDS).
+IDLE_KEEPALIVE_SECONDS = 1.0
+LATENCY_SMOOTHING = 0.2
+DECISIONS = ("run_zone", "run_motion", "run_keepalive", "run_interval", "skip_no_motion", "skip_interval")
+
+class InferenceScheduler:
+    """
+    Decides, frame by frame, whether a camera's frame goes through YOLO.
+
+    A cheap frame difference on a downscaled grayscale copy skips inference
+    while nothing in the scene moves. The processing interval adapts at
+    runtime: it grows while the smoothed capture-to-publish latency is above
+    the budget and shrinks again when there is headroom. While anyone is
+    inside the restricted zone every eligible frame is processed at the
+    minimum interval; an idle scene drops to the maximum interval.
+
+    With `adaptive=False` every `base_interval`-th frame is processed, which
+    makes offline replays reproducible.
+
+    If the owner sets `decision_counters` ({decision: Counter}) and
+    `saved_counter`, every decision and the estimated inference time each
+    skip avoids are also counted there for /metrics.
+    """
+    def __init__(self, base_interval=3, min_interval=MIN_INTERVAL_FRAMES, max_interval=MAX_INTERVAL_FRAMES,
+                 latency_budget=LATENCY_BUDGET_SECONDS, idle_keepalive=IDLE_KEEPALIVE_SECONDS, adaptive=True):
+        self.adaptive = adaptive
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.interval = base_interval
+        self.latency_budget = latency_budget
+        self.idle_keepalive = idle_keepalive
+
+        self._previous_small = None
+        self._frames_since_run = 0
+        self._last_run_time = 0.0
+        self.smoothed_latency = 0.0
+        self.smoothed_inference = 0.0
+        self.motion_fraction = 0.0
+        self.decisions = dict.fromkeys(DECISIONS, 0)
+        self.decision_counters = {}
+        self.saved_counter = None
+
+    def _measure_motion(self, frame):
+        small = cv2.cvtColor(cv2.resize(frame, MOTION_FRAME_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        previous, self._previous_small = self._previous_small, small
+        if previous is None:
+            return 1.0
+        diff = cv2.absdiff(small, previous)
+        return cv2.countNonZero(cv2.threshold(diff, MOTION_PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)[1]) / diff.size
+
+    def should_run(self, frame, now, active_tracks=False, tracks_in_zone=False):
+        """Returns True if this frame should be sent through detection."""
+        self._frames_since_run += 1
+        if not self.adaptive:
+            return self._decide("run_interval" if self._frames_since_run >= self.interval else "skip_interval", now)
+
+        self.motion_fraction = self._measure_motion(frame)
+        has_motion = self.motion_fraction >= MOTION_AREA_FRACTION
+
+        if tracks_in_zone:
+            decision = "run_zone" if self._frames_since_run >= self.min_interval else "skip_interval"
+        elif not has_motion:
+            # Still scenes are re-checked now and then: often enough to keep visible tracks alive,
+            # and at the maximum interval when the scene is empty.
+            keepalive_due = now - self._last_run_time >= self.idle_keepalive
+            if keepalive_due and (active_tracks or self._frames_since_run >= self.max_interval):
+                decision = "run_keepalive"
+            else:
+                decision = "skip_no_motion"
+        else:
+            decision = "run_motion" if self._frames_since_run >= self.interval else "skip_interval"
+        return self._decide(decision, now)
+
+    def _decide(self, decision, now):
+        self.decisions[decision] += 1
+        counter = self.decision_counters.get(decision)
+        if counter: counter.inc()
+        if decision.startswith("run"):
+            self._frames_since_run = 0
+            self._last_run_time = now
+            return True
+        if self.saved_counter: self.saved_counter.inc(self.smoothed_inference)
+        return False
+
+    def record(self, latency, inference_seconds):
+        """Feeds back the measured end-to-end latency and inference time of a processed frame."""
+        a = LATENCY_SMOOTHING
+        self.smoothed_latency = (1 - a) * self.smoothed_latency + a * latency
+        self.smoothed_inference = (1 - a) * self.smoothed_inference + a * inference_seconds
+        if not self.adaptive: return
+        if self.smoothed_latency > self.latency_budget and self.interval < self.max_interval:
+            self.interval += 1
+        elif self.smoothed_latency < 0.5 * self.latency_budget and self.interval > self.min_interval:
+            self.interval -= 1
+
+    def stats(self):
+        """Returns the scheduler's decisions and an estimate of the inference time it avoided."""
+        skipped = self.decisions["skip_no_motion"] + self.decisions["skip_interval"]
+        return {
+            "interval_frames": self.interval,
+            "smoothed_latency_seconds": self.smoothed_latency,
+            "smoothed_inference_seconds": self.smoothed_inference,
+            "motion_fraction": self.motion_fraction,
+            "decisions": dict(self.decisions),
+            "estimated_inference_seconds_saved": skipped * self.smoothed_inference,
+        }
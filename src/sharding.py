@@ -0,0 +1,749 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import cv2
+import numpy as np
+
+from .alerting import get_dispatcher
+from .broadcast import FrameBroadcaster
+from .camera_manager import (CameraManager, DEFAULT_FRAME_HEIGHT, DEFAULT_FRAME_WIDTH, create_clip_recorder,
+                             open_streams)
+from .clip_recorder import CLIP_BUFFER_MB
+from .event_logger import setup_logger
+from .event_store import get_event_store
+from .gallery_watcher import GalleryWatcher
+from .metrics import REGISTRY
+from .recognition_pool import RecognitionPool
+from .scheduler import DECISIONS
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Number of analysis processes; 0 runs the whole pipeline in the web server's process.
+PIPELINE_SHARDS = int(os.environ.get("PIPELINE_SHARDS", "0"))
+ENCODE_WORKERS_PER_SHARD = 1
+SLOTS_PER_CAMERA = 6
+# A slot left queued this long belongs to a stage that is stuck or restarting; it is put back in circulation.
+SLOT_LEASE_SECONDS = 10.0
+STAGE_RESTART_BACKOFF_SECONDS = 1.0
+STAGE_RESTART_BACKOFF_MAX_SECONDS = 30.0
+# A stage that stayed up this long before crashing is restarted without delay.
+STAGE_STABLE_SECONDS = 60.0
+SUPERVISOR_INTERVAL_SECONDS = 0.5
+SHARD_REPORT_SECONDS = 1.0
+SHARD_READY_TIMEOUT_SECONDS = 300.0
+GALLERY_RELOAD_TIMEOUT_SECONDS = 30.0
+MODEL_PATH = 'yolov8n.pt'
+GALLERY_DIR = "registered_faces"
+
+# Who holds a slot: nobody, a pipe between two stages, or (any other value) the pid of the process using it.
+SLOT_FREE, SLOT_QUEUED = 0, -1
+# Counters at the start of each ring. Each one is written by a single process.
+_CAPTURED, _DROPPED, _SKIPPED, _RECONNECTS, _ENDED, _SEQUENCE = range(6)
+_COUNTERS = 6
+
+# What travels between stages instead of the frame itself; small enough to be written to a pipe atomically.
+FrameRef = namedtuple("FrameRef", "camera_id slot sequence timestamp height width")
+
+class FrameRing:
+    """
+    One camera's frame slots in a single shared-memory block.
+
+    The block starts with a header (capture counters, then the holder,
+    sequence number and hand-over time of every slot) followed by the slots,
+    each large enough for one BGR frame at the camera's configured
+    resolution. Stages pass each other FrameRefs; the pixels never leave the
+    block. Only the camera's capture process takes free slots, and a slot is
+    only freed by the process holding it, so the holder table needs no lock.
+    When a later stage falls behind, capture runs out of free slots and drops
+    new frames at the source instead of letting them pile up.
+
+    The main process creates and finally unlinks every ring; a stage process
+    attaches to it by name when the ring is unpickled.
+    """
+    def __init__(self, camera_id, slots, width, height, name=None, create=False):
+        self.camera_id = camera_id
+        self.slots = slots
+        self.width, self.height = width, height
+        self.slot_bytes = width * height * 3
+        header_bytes = 8 * (_COUNTERS + 3 * slots)
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=header_bytes + slots * self.slot_bytes if create else 0)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self.counters = np.ndarray((_COUNTERS,), dtype=np.int64, buffer=buf)
+        self.holders = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=8 * _COUNTERS)
+        self.sequences = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=8 * (_COUNTERS + slots))
+        self.stamps = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=8 * (_COUNTERS + 2 * slots))
+        self._frames = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=buf, offset=header_bytes)
+        if create:
+            self.counters[:] = 0
+            self.holders[:] = SLOT_FREE
+            self.sequences[:] = 0
+
+    def __reduce__(self):
+        return (FrameRing, (self.camera_id, self.slots, self.width, self.height, self.name))
+
+    def view(self, ref):
+        """The frame a FrameRef points at, as an array backed by shared memory."""
+        return self._frames[ref.slot, :ref.height * ref.width * 3].reshape(ref.height, ref.width, 3)
+
+    def _set_holder(self, slot, holder):
+        self.stamps[slot] = time.time()
+        self.holders[slot] = holder
+
+    def acquire(self):
+        """Takes a free slot for the calling (capture) process, or returns None if every slot is in use."""
+        free = np.flatnonzero(self.holders == SLOT_FREE)
+        if len(free) == 0: return None
+        slot = int(free[0])
+        self._set_holder(slot, os.getpid())
+        return slot
+
+    def write(self, slot, frame, timestamp):
+        """Copies a frame into an acquired slot and returns its FrameRef."""
+        if frame.nbytes > self.slot_bytes:
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        height, width = frame.shape[:2]
+        self.counters[_SEQUENCE] += 1
+        ref = FrameRef(self.camera_id, slot, int(self.counters[_SEQUENCE]), timestamp, height, width)
+        np.copyto(self.view(ref), frame)
+        self.sequences[slot] = ref.sequence
+        return ref
+
+    def hand_off(self, ref):
+        """Marks a slot as travelling to the next stage."""
+        self._set_holder(ref.slot, SLOT_QUEUED)
+
+    def claim(self, ref):
+        """Takes over a slot received from a pipe. Returns False if it was reclaimed in the meantime."""
+        if self.holders[ref.slot] != SLOT_QUEUED or self.sequences[ref.slot] != ref.sequence: return False
+        self._set_holder(ref.slot, os.getpid())
+        return True
+
+    def release(self, slot):
+        self._set_holder(slot, SLOT_FREE)
+
+    def reclaim(self, pid=None, lease_seconds=None):
+        """
+        Frees the slots held by a dead process (`pid`) or left queued longer
+        than `lease_seconds`. Called by the main process only. Returns the
+        number of slots freed.
+        """
+        now, freed = time.time(), 0
+        for slot in range(self.slots):
+            holder = int(self.holders[slot])
+            if (pid is not None and holder == pid) or \
+               (lease_seconds is not None and holder == SLOT_QUEUED and now - self.stamps[slot] > lease_seconds):
+                # Invalidates any FrameRef to this slot still waiting in a pipe.
+                self.sequences[slot] = 0
+                self.release(slot)
+                freed += 1
+        return freed
+
+    def stats(self):
+        return {
+            "frames_captured": int(self.counters[_CAPTURED]), "frames_dropped": int(self.counters[_DROPPED]),
+            "frames_skipped": int(self.counters[_SKIPPED]), "reconnects": int(self.counters[_RECONNECTS]),
+            "ended": bool(self.counters[_ENDED]), "slots_in_use": int(np.count_nonzero(self.holders != SLOT_FREE)),
+            "slots": self.slots,
+        }
+
+    def close(self):
+        self.counters = self.holders = self.sequences = self.stamps = self._frames = None
+        try: self.shm.close()
+        except BufferError: pass  # A frame view is still referenced; the mapping goes away with the process.
+
+    def unlink(self):
+        self.close()
+        try: self.shm.unlink()
+        except FileNotFoundError: pass
+
+# --- Stage processes ---
+def _init_stage_process():
+    setup_logger()
+    # Each stage leads its own process group, so the supervisor can take down the recognition
+    # workers of a crashed stage with it; Ctrl+C only reaches the main process, which stops the stages in order.
+    os.setpgrp()
+
+def _stopping(stop_event):
+    return stop_event.is_set() or not multiprocessing.parent_process().is_alive()
+
+def run_capture(ring, config, frames_out, stop_event):
+    """Capture stage: decodes one camera and sends a FrameRef for every frame it copies into a free slot."""
+    _init_stage_process()
+    stream = open_streams([config])[ring.camera_id]
+    captured = dropped = reconnects = 0
+    try:
+        while not _stopping(stop_event):
+            item = stream.read_next(timeout=0.5)
+            # Mirror the stream's counters into the ring, where the main process reads them.
+            ring.counters[_CAPTURED] += stream.frames_captured - captured
+            ring.counters[_DROPPED] += stream.frames_dropped - dropped
+            ring.counters[_RECONNECTS] += stream.reconnects - reconnects
+            captured, dropped, reconnects = stream.frames_captured, stream.frames_dropped, stream.reconnects
+            if item is None:
+                if stream.ended:
+                    ring.counters[_ENDED] = 1
+                    break
+                continue
+            frame, _, timestamp = item
+            slot = ring.acquire()
+            if slot is None:
+                # Every slot is waiting on a later stage: drop at the source.
+                ring.counters[_DROPPED] += 1
+                continue
+            ref = ring.write(slot, frame, timestamp)
+            ring.hand_off(ref)
+            frames_out.send(ref)
+    finally:
+        stream.stop()
+        stream.join(2.0)
+        ring.close()
+
+def run_encoder(rings, frames_in, output, stop_event):
+    """Encode stage: JPEG-encodes annotated frames, frees their slots and sends the bytes to the main process."""
+    _init_stage_process()
+    try:
+        while not _stopping(stop_event):
+            if not frames_in.poll(0.5): continue
+            ref = frames_in.recv()
+            ring = rings[ref.camera_id]
+            if not ring.claim(ref): continue
+            try:
+                ret, buffer = cv2.imencode('.jpg', ring.view(ref))
+            finally:
+                ring.release(ref.slot)
+            # Blocks while the web server falls behind, so the slowdown propagates back to capture.
+            if ret: output.send(("frame", ref.camera_id, buffer.tobytes(), ref.timestamp))
+    except (BrokenPipeError, EOFError):
+        pass  # The main process is shutting down.
+    finally:
+        for ring in rings.values(): ring.close()
+
+class SharedFrameSource:
+    """
+    Stands in for a VideoStream inside an analysis process, serving the
+    frames captured into one camera's ring.
+
+    As with VideoStream, only the newest frame is kept: one superseded
+    before it is read goes straight back to the free slots. The frame
+    returned by `read_next()` stays claimed until `take()` hands it on to
+    an encoder or the next frame is read.
+    """
+    def __init__(self, ring):
+        self.ring = ring
+        self._condition = threading.Condition()
+        self._pending = None
+        self._held = None
+        self.started = False
+        self.stopped = False
+        self.on_frame = None
+        self.capture_counter = None
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+    @property
+    def reconnects(self):
+        return int(self.ring.counters[_RECONNECTS])
+
+    @property
+    def ended(self):
+        return bool(self.ring.counters[_ENDED]) and self._pending is None
+
+    def start(self):
+        self.started = True
+        return self
+
+    def push(self, ref):
+        """Offers a claimed frame; called by the shard's router thread."""
+        with self._condition:
+            if self._pending is not None:
+                self.ring.release(self._pending.slot)
+                self.frames_dropped += 1
+                self.ring.counters[_SKIPPED] += 1
+            self._pending = ref
+            self.frames_received += 1
+            self._condition.notify_all()
+        if self.on_frame: self.on_frame.set()
+        if self.capture_counter: self.capture_counter.inc()
+
+    def read_next(self, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending is not None or self.stopped, timeout)
+            if self._pending is None: return None
+            if self._held is not None: self.ring.release(self._held.slot)
+            ref = self._held = self._pending
+            self._pending = None
+            return self.ring.view(ref), ref.sequence, ref.timestamp
+
+    def take(self):
+        """Gives up the frame returned by the last `read_next()` without freeing its slot."""
+        with self._condition:
+            ref, self._held = self._held, None
+            return ref
+
+    def stats(self):
+        return {"frames_received": self.frames_received, "frames_dropped": self.frames_dropped,
+                "reconnects": self.reconnects, "ended": self.ended}
+
+    def stop(self):
+        with self._condition:
+            self.stopped = True
+            self._condition.notify_all()
+
+class Reporter:
+    """Sends messages from an analysis process to the main process; several threads share one pipe."""
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def send(self, *message):
+        with self._lock:
+            self.conn.send(message)
+
+class ClipTrigger:
+    """Stands in for a ClipRecorder in an analysis process: the JPEGs, and so the clips, live in the main process."""
+    def __init__(self, camera_id, reporter):
+        self.camera_id = camera_id
+        self.reporter = reporter
+        self.triggered = 0
+
+    def trigger(self, prefix, now=None):
+        self.reporter.send("clip", self.camera_id, prefix, now)
+        self.triggered += 1
+
+    def stats(self):
+        return {"triggered": self.triggered}
+
+    def stop(self):
+        pass
+
+class ShardCameraManager(CameraManager):
+    """
+    The CameraManager loop of one analysis process. Frames come from the
+    shard's shared-memory rings and annotated frames are handed, slot and
+    all, to the shard's encode processes in turn.
+    """
+    def __init__(self, model, camera_configs, recognition_pool, gallery_watcher, rings, encoders, reporter,
+                 zone_configs=None):
+        self.rings = rings
+        self.reporter = reporter
+        self._encoders = itertools.cycle(encoders)
+        sources = {camera_id: SharedFrameSource(ring) for camera_id, ring in rings.items()}
+        super().__init__(model, camera_configs, recognition_pool, gallery_watcher, zone_configs=zone_configs, streams=sources)
+
+    def _create_recorder(self, camera_id, config):
+        if not config.get("clip_buffer_mb", CLIP_BUFFER_MB): return None
+        return ClipTrigger(camera_id, self.reporter)
+
+    def _publish(self, pipeline, frame, current_time):
+        ref = pipeline.stream.take()
+        pipeline.stream.ring.hand_off(ref)
+        next(self._encoders).send(ref)
+        pipeline.published_counter.inc()
+
+    def route(self, frames_in, stop_event):
+        """Router thread: claims incoming FrameRefs and offers them to their camera's source."""
+        while not self._stopped and not _stopping(stop_event):
+            if not frames_in.poll(0.5): continue
+            ref = frames_in.recv()
+            pipeline = self.pipelines.get(ref.camera_id)
+            if pipeline is not None and pipeline.stream.ring.claim(ref):
+                pipeline.stream.push(ref)
+
+    def stop(self, timeout=5.0):
+        super().stop()
+        # The loop reads the rings, so it has to finish before they are closed.
+        if self._thread is not None: self._thread.join(timeout)
+
+def run_analysis(shard_id, camera_configs, zone_configs, rings, frames_in, encoders, report, control, stop_event,
+                 model_path=MODEL_PATH):
+    """Analysis stage: detection, tracking, recognition, zones, alerts and overlays for one shard of cameras."""
+    _init_stage_process()
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    recognition_pool = RecognitionPool()
+    gallery_watcher = GalleryWatcher(GALLERY_DIR).start()
+    reporter = Reporter(report)
+    manager = ShardCameraManager(model, camera_configs, recognition_pool, gallery_watcher, rings, encoders, reporter,
+                                 zone_configs=zone_configs)
+    router = threading.Thread(target=manager.route, args=(frames_in, stop_event), name="frame-router", daemon=True)
+    router.start()
+    manager.start()
+    crashed = False
+    try:
+        reporter.send("ready", shard_id)
+        while not _stopping(stop_event) and manager.is_running:
+            if control.poll(SHARD_REPORT_SECONDS) and control.recv() == "reload_gallery":
+                reporter.send("gallery", shard_id, gallery_watcher.reload())
+            reporter.send("stats", shard_id, {
+                "cameras": manager.stats(), "metrics": REGISTRY.snapshot(),
+                "alerts": get_dispatcher().stats_snapshot(), "events": get_event_store().stats_snapshot(),
+            })
+        # The analysis loop only returns on its own once every camera has ended; otherwise it raised.
+        crashed = not _stopping(stop_event) and not all(ring.counters[_ENDED] for ring in rings.values())
+    except (BrokenPipeError, EOFError):
+        pass  # The main process is shutting down.
+    finally:
+        manager.stop()
+        router.join(1.0)
+        recognition_pool.stop()
+        gallery_watcher.stop()
+        get_dispatcher().stop()
+        get_event_store().stop()
+        for ring in rings.values(): ring.close()
+        # Recognition workers still busy would otherwise hold up the exit.
+        for child in multiprocessing.active_children(): child.terminate()
+    if crashed:
+        logger.error(f"Analysis loop of shard {shard_id} died; exiting so the stage is restarted.")
+        sys.exit(1)
+
+# --- Main process ---
+def _kill_group(pid):
+    """Kills whatever is left of a stage's process group, e.g. the recognition workers of a crashed shard."""
+    try: os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError): pass
+
+class Stage:
+    """
+    One supervised stage process and its restart state. `make_args` is
+    called on every (re)start and returns the process arguments, the main
+    process's end of a fresh result pipe (or None) and the pipe ends that
+    only the child needs. `rings` are the cameras the stage serves: a clean
+    exit only counts as finished once all of them have ended.
+    """
+    def __init__(self, name, target, make_args, rings):
+        self.name = name
+        self.target = target
+        self.make_args = make_args
+        self.rings = list(rings)
+        self.process = None
+        self.restarts = 0
+        self.finished = False
+        self.started_at = None
+        self.restart_at = None
+        self.backoff = STAGE_RESTART_BACKOFF_SECONDS
+
+    def start(self, ctx):
+        """Starts the process; returns the main process's end of its result pipe, if it has one."""
+        args, reader, child_ends = self.make_args()
+        # Not a daemon: analysis stages start their own recognition worker processes.
+        self.process = ctx.Process(target=self.target, args=args, name=self.name)
+        self.process.start()
+        # The child has its own copies; closing ours lets the reader see EOF when the child dies.
+        for conn in child_ends: conn.close()
+        self.started_at = time.monotonic()
+        return reader
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def status(self):
+        return {"pid": self.process.pid if self.process else None, "alive": self.alive,
+                "restarts": self.restarts, "finished": self.finished}
+
+class CameraOutput:
+    """What the web server needs from a camera in sharded mode: its viewers' broadcaster and its clip recorder."""
+    def __init__(self, camera_id, recorder):
+        self.camera_id = camera_id
+        self.broadcaster = FrameBroadcaster()
+        self.recorder = recorder
+
+class ShardedCameraManager:
+    """
+    Runs the pipeline as supervised processes so it can use every core:
+
+    - one capture process per camera, decoding into the camera's FrameRing;
+    - `shards` analysis processes, each batching YOLO over its share of the
+      cameras and tracking, recognizing (on its own RecognitionPool),
+      applying zone rules and drawing overlays in place in shared memory;
+    - `encode_workers` JPEG encoders per shard;
+    - this process, which publishes the JPEGs to viewers and clip recorders.
+
+    Stages send each other FrameRefs over one-way pipes; only the encoded
+    JPEGs and per-shard reports travel back to this process, each stage on
+    a pipe of its own that is replaced when the stage restarts. (A
+    multiprocessing.Queue is not used because a process killed while
+    reading one leaves its lock held.) Backpressure comes from the bounded
+    slots: a stage that falls behind stalls the one before it until capture
+    drops frames. A supervisor thread restarts any stage that crashes (with
+    exponential backoff), frees the slots it held and returns slots stuck
+    in a pipe for longer than SLOT_LEASE_SECONDS. Offers the same `get()`,
+    `camera_ids`, `stats()` and `stop()` as CameraManager.
+    """
+    def __init__(self, camera_configs, shards=PIPELINE_SHARDS, encode_workers=ENCODE_WORKERS_PER_SHARD,
+                 zone_configs=None, model_path=MODEL_PATH, slots=SLOTS_PER_CAMERA, registry=REGISTRY):
+        # Spawned, not forked: this process already runs the web server's threads.
+        self._ctx = multiprocessing.get_context("spawn")
+        self.registry = registry
+        self.shard_count = max(1, min(shards, len(camera_configs)))
+        self._stop_event = self._ctx.Event()
+        self._stopped = False
+        self._supervisor = None
+        self._reports = threading.Condition()
+        self._readers = {}  # main-side pipe end -> stage name
+        self._controls = {}  # shard id -> main-side control pipe end
+        self._ready_shards = set()
+        self._gallery_replies = {}
+        self._shard_stats = {}
+        self._totals = {}
+
+        self.rings, self.outputs, self.shard_of = {}, {}, {}
+        for config in camera_configs:
+            camera_id = str(config["id"])
+            self.rings[camera_id] = FrameRing(camera_id, slots, config.get("width", DEFAULT_FRAME_WIDTH),
+                                              config.get("height", DEFAULT_FRAME_HEIGHT), create=True)
+            self.outputs[camera_id] = CameraOutput(camera_id, create_clip_recorder(camera_id, config))
+            self._register_camera_metrics(camera_id)
+
+        self.stages = []
+        for shard_id in range(self.shard_count):
+            shard_configs = camera_configs[shard_id::self.shard_count]
+            shard_rings = {str(c["id"]): self.rings[str(c["id"])] for c in shard_configs}
+            # Pipes between stages outlive restarts: FrameRefs are written atomically, so a new reader picks up cleanly.
+            frames_in, frames_out = self._ctx.Pipe(duplex=False)
+            encoder_pipes = [self._ctx.Pipe(duplex=False) for _ in range(encode_workers)]
+            for config in shard_configs:
+                camera_id = str(config["id"])
+                self.shard_of[camera_id] = shard_id
+                args = (self.rings[camera_id], config, frames_out, self._stop_event)
+                self.stages.append(Stage(f"capture-{camera_id}", run_capture, lambda args=args: (args, None, ()),
+                                         [self.rings[camera_id]]))
+            self.stages.append(Stage(f"analysis-{shard_id}", run_analysis, lambda shard_id=shard_id, configs=shard_configs,
+                                     rings=shard_rings, frames_in=frames_in, encoders=[w for _, w in encoder_pipes]:
+                                     self._analysis_args(shard_id, configs, zone_configs, rings, frames_in, encoders, model_path),
+                                     shard_rings.values()))
+            for worker, (encoder_in, _) in enumerate(encoder_pipes):
+                self.stages.append(Stage(f"encode-{shard_id}-{worker}", run_encoder,
+                                         lambda rings=shard_rings, encoder_in=encoder_in: self._encoder_args(rings, encoder_in),
+                                         shard_rings.values()))
+        for stage in self.stages:
+            registry.gauge("stage_restarts", lambda stage=stage: stage.restarts, stage=stage.name)
+            registry.gauge("stage_alive", lambda stage=stage: stage.alive, stage=stage.name)
+
+    def _analysis_args(self, shard_id, configs, zone_configs, rings, frames_in, encoders, model_path):
+        report_in, report_out = self._ctx.Pipe(duplex=False)
+        control_in, control_out = self._ctx.Pipe(duplex=False)
+        old = self._controls.get(shard_id)
+        if old is not None: old.close()
+        self._controls[shard_id] = control_out
+        return ((shard_id, configs, zone_configs, rings, frames_in, encoders, report_out, control_in, self._stop_event,
+                 model_path), report_in, (report_out, control_in))
+
+    def _encoder_args(self, rings, encoder_in):
+        output_in, output_out = self._ctx.Pipe(duplex=False)
+        return (rings, encoder_in, output_out, self._stop_event), output_in, (output_out,)
+
+    def _register_camera_metrics(self, camera_id):
+        registry, ring, output = self.registry, self.rings[camera_id], self.outputs[camera_id]
+        output.captured_counter = registry.counter("frames_captured_total", camera=camera_id)
+        output.published_counter = registry.counter("frames_published_total", camera=camera_id)
+        # Counted inside the analysis process; mirrored from its reports, keyed as in REGISTRY.snapshot().
+        output.shard_counters = {f'frames_processed_total{{camera="{camera_id}"}}':
+                                 registry.counter("frames_processed_total", camera=camera_id),
+                                 f'inference_seconds_saved_total{{camera="{camera_id}"}}':
+                                 registry.counter("inference_seconds_saved_total", camera=camera_id)}
+        for decision in DECISIONS:
+            output.shard_counters[f'inference_decisions_total{{camera="{camera_id}",decision="{decision}"}}'] = \
+                registry.counter("inference_decisions_total", camera=camera_id, decision=decision)
+        registry.gauge("frames_dropped", lambda: ring.counters[_DROPPED] + ring.counters[_SKIPPED], camera=camera_id)
+        registry.gauge("stream_reconnects", lambda: ring.counters[_RECONNECTS], camera=camera_id)
+        registry.gauge("frame_slots_in_use", lambda: ring.stats()["slots_in_use"], camera=camera_id)
+        registry.gauge("stream_viewers", lambda: output.broadcaster.subscriber_count, camera=camera_id)
+        registry.gauge("active_tracks", lambda: self._camera_report(camera_id)["tracked_persons"], camera=camera_id)
+        recorder = output.recorder
+        if recorder:
+            registry.gauge("clip_buffer_bytes", lambda: recorder.buffer_bytes, camera=camera_id)
+            registry.gauge("clip_buffer_limit_bytes", lambda: recorder.max_bytes, camera=camera_id)
+            registry.gauge("clips_written", lambda: recorder.clips_written, camera=camera_id)
+            registry.gauge("clips_failed", lambda: recorder.clips_failed + recorder.clips_dropped, camera=camera_id)
+
+    @property
+    def is_running(self):
+        return self._supervisor is not None and self._supervisor.is_alive()
+
+    @property
+    def camera_ids(self):
+        return list(self.outputs)
+
+    def get(self, camera_id):
+        return self.outputs.get(camera_id)
+
+    def start(self):
+        for stage in self.stages:
+            self._start_stage(stage)
+        threading.Thread(target=self._drain, name="shard-results", daemon=True).start()
+        self._supervisor = threading.Thread(target=self._supervise, name="stage-supervisor", daemon=True)
+        self._supervisor.start()
+        return self
+
+    def _start_stage(self, stage):
+        reader = stage.start(self._ctx)
+        if reader is not None:
+            with self._reports:
+                self._readers[reader] = stage.name
+
+    def wait_ready(self, timeout=SHARD_READY_TIMEOUT_SECONDS):
+        """Blocks until every analysis process has loaded its model. Returns False on timeout."""
+        with self._reports:
+            return self._reports.wait_for(lambda: len(self._ready_shards) == self.shard_count, timeout)
+
+    # --- Supervision ---
+    def _supervise(self):
+        while not self._stop_event.wait(SUPERVISOR_INTERVAL_SECONDS):
+            now = time.monotonic()
+            for stage in self.stages:
+                if stage.finished or stage.alive: continue
+                if stage.restart_at is None:
+                    self._on_stage_exit(stage, now)
+                elif now >= stage.restart_at:
+                    stage.restart_at = None
+                    stage.restarts += 1
+                    logger.info(f"Restarting stage '{stage.name}' (restart #{stage.restarts}).")
+                    self._start_stage(stage)
+            for ring in self.rings.values():
+                expired = ring.reclaim(lease_seconds=SLOT_LEASE_SECONDS)
+                if expired: logger.warning(f"Camera '{ring.camera_id}': returned {expired} frame slots stuck in a pipe.")
+            self._sync_counters()
+
+    def _on_stage_exit(self, stage, now):
+        process = stage.process
+        _kill_group(process.pid)
+        reclaimed = sum(ring.reclaim(pid=process.pid) for ring in self.rings.values())
+        if process.exitcode == 0 and all(ring.counters[_ENDED] for ring in stage.rings):
+            # A capture whose video file ended, or a stage whose cameras all did; any other exit is a crash.
+            stage.finished = True
+            logger.info(f"Stage '{stage.name}' finished.")
+            return
+        if now - stage.started_at >= STAGE_STABLE_SECONDS:
+            stage.backoff = STAGE_RESTART_BACKOFF_SECONDS
+        stage.restart_at = now + stage.backoff
+        logger.error(f"Stage '{stage.name}' (pid {process.pid}) died with exit code {process.exitcode}; "
+                     f"freed {reclaimed} frame slots, restarting in {stage.backoff:.0f}s.")
+        stage.backoff = min(stage.backoff * 2, STAGE_RESTART_BACKOFF_MAX_SECONDS)
+
+    def _advance(self, counter, key, total):
+        """Moves a counter along with a total kept by another process, which starts again from 0 if that process restarts."""
+        last = self._totals.get(key, 0)
+        counter.inc(total - last if total >= last else total)
+        self._totals[key] = total
+
+    def _sync_counters(self):
+        for camera_id, output in self.outputs.items():
+            self._advance(output.captured_counter, (camera_id, "captured"), int(self.rings[camera_id].counters[_CAPTURED]))
+            counters = self._shard_stats.get(self.shard_of[camera_id], {}).get("metrics", {}).get("counters", {})
+            for key, counter in output.shard_counters.items():
+                self._advance(counter, key, counters.get(key, {}).get("total", 0))
+
+    # --- Results from the stages ---
+    def _drain(self):
+        """Reads every stage's result pipe: JPEGs for the viewers, clip triggers and shard reports."""
+        while not self._stopped:
+            with self._reports:
+                readers = list(self._readers)
+            if not readers:
+                time.sleep(0.1)
+                continue
+            for reader in wait(readers, timeout=0.5):
+                try:
+                    kind, *payload = reader.recv()
+                except (EOFError, OSError):
+                    # The stage exited; its restart brings a new pipe.
+                    with self._reports:
+                        self._readers.pop(reader, None)
+                    reader.close()
+                    continue
+                self._handle(kind, payload)
+
+    def _handle(self, kind, payload):
+        if kind == "frame":
+            camera_id, jpeg_bytes, timestamp = payload
+            output = self.outputs[camera_id]
+            output.broadcaster.publish(jpeg_bytes)
+            if output.recorder: output.recorder.add(jpeg_bytes, timestamp)
+            output.published_counter.inc()
+        elif kind == "clip":
+            camera_id, prefix, now = payload
+            recorder = self.outputs[camera_id].recorder
+            if recorder: recorder.trigger(prefix, now)
+        else:
+            with self._reports:
+                if kind == "stats": self._shard_stats[payload[0]] = payload[1]
+                elif kind == "ready": self._ready_shards.add(payload[0])
+                elif kind == "gallery": self._gallery_replies[payload[0]] = payload[1]
+                self._reports.notify_all()
+
+    def reload_gallery(self, timeout=GALLERY_RELOAD_TIMEOUT_SECONDS):
+        """Asks every analysis process to reload the face gallery and returns what changed, per shard."""
+        with self._reports:
+            self._gallery_replies.clear()
+            controls = list(self._controls.values())
+        for control in controls:
+            try: control.send("reload_gallery")
+            except OSError: pass  # That shard is restarting and loads the current gallery anyway.
+        with self._reports:
+            self._reports.wait_for(lambda: len(self._gallery_replies) == self.shard_count, timeout)
+            return {"shards": {str(shard): changes for shard, changes in self._gallery_replies.items()}}
+
+    # --- Reporting ---
+    def _camera_report(self, camera_id):
+        return self._shard_stats.get(self.shard_of[camera_id], {}).get("cameras", {}).get(camera_id, {})
+
+    def stats(self):
+        """Per-camera statistics in the same shape as CameraManager.stats(), from the rings and the latest shard reports."""
+        cameras = {}
+        for camera_id, output in self.outputs.items():
+            report = self._camera_report(camera_id)
+            cameras[camera_id] = {
+                "stream": self.rings[camera_id].stats(),
+                "shard": self.shard_of[camera_id],
+                "capture_fps": output.captured_counter.rate(),
+                "processed_fps": report.get("processed_fps", 0.0),
+                "published_fps": output.published_counter.rate(),
+                "scheduler": report.get("scheduler"),
+                "tracked_persons": report.get("tracked_persons", 0),
+                "viewers": output.broadcaster.subscriber_count,
+                "clips": output.recorder.stats() if output.recorder else None,
+            }
+        return cameras
+
+    def pipeline_stats(self):
+        """Stage processes and their restarts, plus each shard's own metrics, alert and event counters."""
+        with self._reports:
+            shards = {str(shard): {k: v for k, v in report.items() if k != "cameras"}
+                      for shard, report in self._shard_stats.items()}
+        return {"stages": {stage.name: stage.status() for stage in self.stages}, "shards": shards}
+
+    def health(self):
+        """Short summary for the health endpoints."""
+        return {"restarts": sum(stage.restarts for stage in self.stages),
+                "stages_down": [stage.name for stage in self.stages if not stage.finished and not stage.alive]}
+
+    def stop(self, timeout=10.0):
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for stage in self.stages:
+            if stage.process is None: continue
+            stage.process.join(max(0.0, deadline - time.monotonic()))
+            if stage.process.is_alive():
+                logger.warning(f"Stage '{stage.name}' did not stop in time; terminating it.")
+                stage.process.terminate()
+                stage.process.join(1.0)
+            _kill_group(stage.process.pid)
+        self._stopped = True
+        for output in self.outputs.values():
+            output.broadcaster.close()
+            if output.recorder: output.recorder.stop()
+        for ring in self.rings.values():
+            ring.unlink()
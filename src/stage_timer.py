@@ -0,0 +1,37 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+class NullStageTimer:
+    """Stage timer that records nothing; the default for the live pipeline."""
+    def stage(self, name):
+        return nullcontext()
+
+NULL_TIMER = NullStageTimer()
+
+class StageTimer:
+    """Collects every duration per pipeline stage for offline percentile reports."""
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+
+    def summary(self):
+        """Returns {stage: {count, mean, p50, p95, p99, max}} in milliseconds."""
+        report = {}
+        for name, samples in self.samples.items():
+            values = np.asarray(samples) * 1000.0
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            report[name] = {
+                "count": len(values), "mean_ms": float(values.mean()), "p50_ms": float(p50),
+                "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(values.max()),
+            }
+        return report
@@ -1,24 +1,43 @@
-from deep_sort_realtime.deepsort_tracker import DeepSort
+from .iou_tracker import IoUTracker
 
-def initialize_tracker():
+# --- CONFIGURATION ---
+# "deepsort" runs an appearance embedder on every detection; "iou" tracks on box
+# geometry alone and is far cheaper on CPU-only machines.
+TRACKER_BACKENDS = ("deepsort", "iou")
+DEFAULT_TRACKER = "deepsort"
+
+def initialize_tracker(kind=DEFAULT_TRACKER):
     """
-    Initializes and returns a DeepSort tracker object.
+    Initializes and returns a tracker object.
+
+    Args:
+        kind (str): One of TRACKER_BACKENDS.
+
+    Both backends take detections through `update_tracks(detections, frame=...)`
+    and return tracks with `track_id`, `to_ltrb()`, `is_confirmed()` and
+    `time_since_update`.
     """
     # These parameters are tuned for a balance of performance and tracking accuracy.
     # max_age: How long to keep tracking a person without detecting them again.
     # n_init: How many initial detections are needed to confirm a new track.
-    return DeepSort(max_age=30, n_init=3, nms_max_overlap=1.0)
+    if kind == "iou":
+        return IoUTracker(max_age=30, n_init=3)
+    if kind == "deepsort":
+        # Imported here so the IoU mode works without deep_sort_realtime and its torch embedder.
+        from deep_sort_realtime.deepsort_tracker import DeepSort
+        return DeepSort(max_age=30, n_init=3, nms_max_overlap=1.0)
+    raise ValueError(f"Unknown tracker '{kind}'; expected one of {TRACKER_BACKENDS}")
 
 def update_tracker_with_detections(tracker, detections, frame):
     """
     Updates the tracker with new detections and returns the active tracks.
-    
+
     Args:
-        tracker (DeepSort): The DeepSort tracker instance.
+        tracker (DeepSort | IoUTracker): The tracker instance.
         detections (list): A list of detections from the YOLO model.
-        frame (np.ndarray): The current video frame.
-                           
+        frame (np.ndarray): The current video frame (unused by the IoU tracker).
+
     Returns:
         list: A list of the currently active tracks.
     """
-    return tracker.update_tracks(detections, frame=frame)
\ No newline at end of file
+    return tracker.update_tracks(detections, frame=frame)
@@ -1,36 +1,201 @@
 import cv2
+import os
 import time
-from threading import Thread
+import logging
+from threading import Condition, Event, Thread
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+RING_BUFFER_SIZE = 4
+RECONNECT_BACKOFF_SECONDS = 0.5
+RECONNECT_BACKOFF_MAX_SECONDS = 10.0
 
 class VideoStream:
-    """A class to read frames from a camera in a dedicated thread."""
-    def __init__(self, src=0, width=960, height=540):
-        self.stream = cv2.VideoCapture(src)
-        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-        (self.grabbed, self.frame) = self.stream.read()
+    """
+    A class to read frames from a camera, stream URL or video file in a
+    dedicated thread.
+
+    Frames are captured into a small ring of reused buffers and stamped with
+    a monotonically increasing sequence number and a capture timestamp.
+    Consumers call `read_next()`, which blocks until a frame newer than the
+    last one they received is available, so the same frame is never
+    processed twice. The slot handed to the consumer is not overwritten
+    until its next `read_next()` call. If the source stops delivering
+    frames, the stream reconnects with exponential backoff.
+
+    The stream is designed for a single consumer.
+    """
+    def __init__(self, src=0, width=960, height=540, buffer_size=RING_BUFFER_SIZE,
+                 loop=False, realtime=True, on_frame=None):
+        if buffer_size < 3:
+            raise ValueError("buffer_size must be at least 3 (latest, held and one being written)")
+        self.src = src
+        self.width, self.height = width, height
+        self.is_file = isinstance(src, str) and os.path.isfile(src)
+        self.loop = loop
+        # Video files are paced at their native frame rate unless realtime is False.
+        self.realtime = realtime
+        self.on_frame = on_frame
+        self.stream = self._open()
+
+        self._condition = Condition()
+        self._ring = [None] * buffer_size
+        self._sequences = [0] * buffer_size
+        self._timestamps = [0.0] * buffer_size
+        self._latest = -1
+        self._held = -1
+        self._sequence = 0
+        self._last_read_sequence = 0
+        self._stop_event = Event()
+
+        self.grabbed, self.frame = False, None
         self.stopped = False
+        self.started = False
+        self._thread = None
+        self.ended = False
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        # Optional metrics counter (anything with inc()) bumped for every captured frame.
+        self.capture_counter = None
+
+    def _open(self):
+        stream = cv2.VideoCapture(self.src)
+        if not self.is_file:
+            stream.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            stream.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return stream
 
     def start(self):
-        """Starts the thread to read frames from the video stream."""
-        # --- THIS IS THE FIX ---
+        """Starts the thread to read frames from the video stream. Calling it again is a no-op."""
+        if self.started: return self
+        self.started = True
         # Create the thread and set it as a daemon thread
-        t = Thread(target=self.update, args=())
+        t = Thread(target=self.update, args=(), name=f"video-stream-{self.src}")
         t.daemon = True # This ensures the thread will exit when the main program does
         t.start()
+        self._thread = t
         return self
 
+    def _next_write_slot(self):
+        """Picks a slot that is neither the latest frame nor the one held by the consumer."""
+        with self._condition:
+            n = len(self._ring)
+            slot = (self._latest + 1) % n
+            while slot == self._latest or slot == self._held:
+                slot = (slot + 1) % n
+            return slot
+
+    def _handle_read_failure(self):
+        """Rewinds, ends or reconnects when the source stops returning frames. Returns False to stop."""
+        if self.is_file and self.loop:
+            self.stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return True
+        if self.is_file:
+            logger.info(f"Video file '{self.src}' finished.")
+            with self._condition:
+                self.ended = True
+                self._condition.notify_all()
+            if self.on_frame: self.on_frame.set()
+            return False
+
+        logger.warning(f"Video source '{self.src}' stopped delivering frames. Reconnecting...")
+        delay = RECONNECT_BACKOFF_SECONDS
+        while not self._stop_event.wait(delay):
+            self.stream.release()
+            self.stream = self._open()
+            self.reconnects += 1
+            if self.stream.isOpened():
+                grabbed = self.stream.grab()
+                if grabbed:
+                    logger.info(f"Video source '{self.src}' reconnected.")
+                    return True
+            delay = min(delay * 2, RECONNECT_BACKOFF_MAX_SECONDS)
+        return False
+
     def update(self):
         """The main loop of the thread that continuously reads frames."""
+        frame_interval = 0.0
+        if self.is_file and self.realtime:
+            fps = self.stream.get(cv2.CAP_PROP_FPS)
+            frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        next_frame_time = time.monotonic()
+
         while not self.stopped:
-            (self.grabbed, self.frame) = self.stream.read()
+            slot = self._next_write_slot()
+            # Decode straight into the reused buffer; OpenCV only reallocates if the size changes.
+            grabbed, frame = self.stream.read(self._ring[slot])
+            if not grabbed or frame is None:
+                if not self._handle_read_failure(): break
+                continue
+
+            if frame_interval:
+                next_frame_time += frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0: time.sleep(delay)
+                else: next_frame_time = time.monotonic()
+
+            with self._condition:
+                if self._sequence > self._last_read_sequence:
+                    # The previous frame was overwritten before anyone read it.
+                    self.frames_dropped += 1
+                self._sequence += 1
+                self._ring[slot] = frame
+                self._sequences[slot] = self._sequence
+                self._timestamps[slot] = time.time()
+                self._latest = slot
+                self.grabbed, self.frame = True, frame
+                self.frames_captured += 1
+                self._condition.notify_all()
+            if self.on_frame: self.on_frame.set()
+            if self.capture_counter: self.capture_counter.inc()
+
         # When the loop is stopped, release the camera
         self.stream.release()
 
+    def read_next(self, timeout=None):
+        """
+        Blocks until a frame newer than the last one returned is available.
+
+        Returns:
+            tuple: (frame, sequence, timestamp), or None on timeout or once
+                   the stream has ended or been stopped.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._sequence > self._last_read_sequence or self.ended or self.stopped, timeout)
+            if self._sequence == self._last_read_sequence:
+                return None
+            slot = self._latest
+            self._held = slot
+            self._last_read_sequence = self._sequences[slot]
+            return self._ring[slot], self._sequences[slot], self._timestamps[slot]
+
+    def wait_first_frame(self, timeout=None):
+        """Blocks until the first frame has been captured. Returns False on timeout or if the stream ended first."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._sequence > 0 or self.ended or self.stopped, timeout) and self._sequence > 0
+
     def read(self):
         """Returns the most recent frame read by the thread."""
         return self.frame
 
+    def stats(self):
+        """Returns capture counters for monitoring."""
+        with self._condition:
+            return {
+                "frames_captured": self.frames_captured, "frames_dropped": self.frames_dropped,
+                "reconnects": self.reconnects, "sequence": self._sequence, "ended": self.ended,
+            }
+
     def stop(self):
         """Signals the thread to stop."""
-        self.stopped = True
\ No newline at end of file
+        self.stopped = True
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """Waits for the capture thread to release the source after `stop()`."""
+        if self._thread is not None: self._thread.join(timeout)
@@ -0,0 +1,124 @@
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+# --- CONFIGURATION ---
+ZONE_CONFIG_PATH = "zones.json"
+# Zone masks are rasterized at 1/N of the frame resolution; 2 keeps them within a pixel or two.
+ZONE_RASTER_SCALE = 2
+DEFAULT_DWELL_SECONDS = 10.0
+# Status -> seconds a person may stay before an alert; 0 alerts on entry.
+# Statuses without a rule (allowed, known) move freely.
+DEFAULT_ZONE_RULES = {"banned": 0.0, "unknown": DEFAULT_DWELL_SECONDS}
+_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+class Zone:
+    """A named polygon with per-status dwell rules."""
+    def __init__(self, name, polygon, rules=None, color=(0, 0, 255)):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError(f"Zone '{name}' needs at least 3 points")
+        self.rules = {status: float(seconds) for status, seconds in (DEFAULT_ZONE_RULES if rules is None else rules).items()}
+        self.color = tuple(color)
+
+    @classmethod
+    def from_rect(cls, name, rect, **kwargs):
+        x1, y1, x2, y2 = rect
+        return cls(name, [(x1, y1), (x2, y1), (x2, y2), (x1, y2)], **kwargs)
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds a zone from {"name", "polygon": [[x, y], ...] or "rect": [x1, y1, x2, y2], "rules", "color"}."""
+        kwargs = {"rules": config.get("rules"), "color": config.get("color", (0, 0, 255))}
+        if "rect" in config:
+            return cls.from_rect(config["name"], config["rect"], **kwargs)
+        return cls(config["name"], config["polygon"], **kwargs)
+
+    def dwell_limit(self, status):
+        """Seconds a person with this status may stay, or None if the zone does not apply to them."""
+        return self.rules.get(status)
+
+def load_zone_configs(path=ZONE_CONFIG_PATH):
+    """
+    Reads per-camera zones from a JSON file, e.g.:
+        {"entrance": [{"name": "stockroom_door", "polygon": [[0, 0], [350, 0], [350, 720], [0, 720]],
+                       "rules": {"banned": 0, "unknown": 5}}]}
+    Returns an empty dict if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def foot_points(boxes):
+    """Bottom-centre points of (N, 4) ltrb boxes: where a person stands on the floor."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+
+class ZoneEngine:
+    """
+    Hit-tests points against all of a camera's zones at once.
+
+    Every zone is rasterized once into a bitmask image (bit i of a pixel is
+    set when the pixel lies inside zone i; overlapping zones are fine), so
+    testing any number of points is a single fancy-indexing lookup whose
+    cost does not depend on how many zones there are or how complex their
+    polygons are. The raster is rebuilt only if the frame size changes.
+    """
+    def __init__(self, zones, scale=ZONE_RASTER_SCALE):
+        self.zones = list(zones)
+        names = [zone.name for zone in self.zones]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate zone names: {names}")
+        self.by_name = {zone.name: zone for zone in self.zones}
+        self.scale = scale
+        self._raster = None
+        self._frame_shape = None
+
+    def _build(self, height, width):
+        h, w = math.ceil(height / self.scale), math.ceil(width / self.scale)
+        raster = np.zeros((max(1, math.ceil(len(self.zones) / 64)), h, w), dtype=np.uint64)
+        mask = np.zeros((h, w), dtype=np.uint8)
+        for i, zone in enumerate(self.zones):
+            mask.fill(0)
+            cv2.fillPoly(mask, [np.round(zone.polygon / self.scale).astype(np.int32)], 1)
+            raster[i // 64] |= mask.astype(np.uint64) << np.uint64(i % 64)
+        self._raster = raster
+        self._frame_shape = (height, width)
+
+    def hit_test(self, points, frame_shape):
+        """
+        Args:
+            points: (P, 2) array of x, y pixel coordinates.
+            frame_shape: Shape of the frame the points come from.
+
+        Returns:
+            np.ndarray: (P, Z) boolean membership matrix.
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if not self.zones or len(points) == 0:
+            return np.zeros((len(points), len(self.zones)), dtype=bool)
+        if self._frame_shape != tuple(frame_shape[:2]):
+            self._build(*frame_shape[:2])
+        _, h, w = self._raster.shape
+        xs = np.clip((points[:, 0] / self.scale).astype(np.intp), 0, w - 1)
+        ys = np.clip((points[:, 1] / self.scale).astype(np.intp), 0, h - 1)
+        words = self._raster[:, ys, xs]  # (W, P)
+        membership = (words[:, :, None] & _BITS) != 0  # (W, P, 64)
+        return membership.transpose(1, 0, 2).reshape(len(points), -1)[:, :len(self.zones)]
+
+    def zones_for_boxes(self, boxes, frame_shape):
+        """Returns, for each ltrb box, the set of zone names its foot-point is in."""
+        if len(boxes) == 0: return []
+        membership = self.hit_test(foot_points(boxes), frame_shape)
+        return [{self.zones[i].name for i in np.flatnonzero(row)} for row in membership]
+
+    def draw(self, frame):
+        for zone in self.zones:
+            cv2.polylines(frame, [zone.polygon], True, zone.color, 2)
+            x, y = zone.polygon.min(axis=0)
+            cv2.putText(frame, zone.name, (int(x) + 10, int(y) + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)